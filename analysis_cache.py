@@ -0,0 +1,175 @@
+"""
+Persistent cache of video analysis results.
+
+Results are keyed by a hash of the video's contents together with every
+parameter that shapes the answer (prompt version, model, frame selection,
+quick or detailed), so re-analyzing an unchanged recording is answered
+locally while any change to the prompts or the video misses.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+from utils import file_digest
+
+
+class AnalysisCache:
+    """SQLite-backed result cache with LRU size and age limits.
+
+    File hashes are remembered per (path, size, mtime), so a hit on a large
+    recording does not read the whole file again. The database is opened
+    on first use.
+    """
+
+    def __init__(self, path="data/analysis_cache.db", max_entries=1000,
+                 max_bytes=50 * 1024 * 1024, max_age_days=30):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = None
+        self._lock = Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    content_hash TEXT,
+                    video_path TEXT,
+                    detailed INTEGER,
+                    params TEXT,
+                    result TEXT,
+                    size INTEGER,
+                    created REAL,
+                    last_used REAL
+                );
+                CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+                CREATE TABLE IF NOT EXISTS file_hashes (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    content_hash TEXT
+                );
+            """)
+        return self._conn
+
+    def content_hash(self, video_path):
+        """Hash of a file's contents, reusing the last one if it is unchanged."""
+        path = os.path.abspath(video_path)
+        info = os.stat(path)
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT content_hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, info.st_size, info.st_mtime_ns)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        content_hash = file_digest(path)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, content_hash) VALUES (?, ?, ?, ?)",
+                (path, info.st_size, info.st_mtime_ns, content_hash)
+            )
+            conn.commit()
+        return content_hash
+
+    @staticmethod
+    def make_key(content_hash, params):
+        """Cache key for a video hash and the analysis parameters."""
+        material = json.dumps({"content": content_hash, "params": params}, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key, count=True):
+        """Cached result for ``key``, or None. Expired entries count as misses.
+
+        ``count=False`` leaves the hit/miss counters alone, for lookups that
+        follow another one (such as the workflow of a cached analysis).
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT result, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.max_age:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                conn.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                if count:
+                    self.misses += 1
+                return None
+            conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            conn.commit()
+            if count:
+                self.hits += 1
+            return row[0]
+
+    def put(self, key, content_hash, video_path, params, result):
+        """Store a result, then evict down to the size limits."""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, content_hash, video_path, detailed, params, result, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content_hash, os.path.abspath(video_path) if video_path else None, int(params.get("detailed", False)),
+                 json.dumps(params, sort_keys=True), result, len(result.encode("utf-8")), now, now)
+            )
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones over the limits."""
+        expired = conn.execute("DELETE FROM results WHERE created < ?", (now - self.max_age,)).rowcount
+        self.evictions += expired
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY last_used").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM results")
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, total = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "max_age_days": self.max_age / (24 * 3600),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
+
+
+analysis_cache = AnalysisCache()
@@ -1,16 +1,61 @@
 """Video Analysis Manager with Workflow Generation"""
 import asyncio
+import hashlib
+import json
 import sys
 import os
+import time
+import uuid
+from glob import glob
 from pathlib import Path
+from typing import Callable, Optional
 
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
-from claude_api import video_analyzer
-from core import workflow_manager
+from analysis_cache import analysis_cache
+from claude_api import analysis_failed, format_offset, video_analyzer
+from frame_cache import frame_cache
+from recorder import load_segment_manifest
+from core import recording_manager, workflow_manager
+
+# Recordings analyzed at once by a batch unless asked otherwise
+BATCH_CONCURRENCY = 4
+
+# Detailed analyses of recordings longer than this are split into windows
+LONG_VIDEO_SECONDS = 900
+
+# Windows (or finished segments) of one recording analyzed at once
+LONG_VIDEO_WORKERS = 8
+
 
 class AnalysisManager:
-    async def analyze_video(self, video_path, detailed=False):
-        """Analyze video with Claude AI and generate workflow"""
+    def __init__(self):
+        self.ws_broadcast: Optional[Callable] = None
+        self.batches = {}
+        self._batch_tasks = set()
+
+    def set_ws_broadcast(self, broadcast_fn: Callable):
+        """Set WebSocket broadcast function for batch progress"""
+        self.ws_broadcast = broadcast_fn
+
+    async def _broadcast(self, message):
+        if self.ws_broadcast:
+            try:
+                await self.ws_broadcast(message)
+            except Exception as e:
+                print(f"Error broadcasting analysis update: {e}")
+
+    async def analyze_video(self, video_path, detailed=False, generate_workflow=True, stream=False,
+                            long_video=None, request_id=None):
+        """Analyze video with Claude AI and generate workflow
+
+        With stream=True the reply text is broadcast as analysis_delta
+        events while it is generated, tagged with request_id so a client
+        can tell its own analysis from others; the full result is returned
+        as usual. long_video splits a detailed analysis into time windows analyzed in
+        parallel (None: only for recordings over LONG_VIDEO_SECONDS).
+        """
+        started = time.monotonic()
+        first_token = {}
         try:
             # Convert to absolute path if relative
             if not os.path.isabs(video_path):
@@ -25,6 +70,10 @@ class AnalysisManager:
                     if os.path.exists(abs_path):
                         video_path = abs_path
             
+            # A segmented recording can be passed as its folder or manifest
+            if os.path.isdir(video_path):
+                video_path = os.path.join(video_path, "manifest.json")
+
             # Verify file exists
             if not os.path.exists(video_path):
                 return {
@@ -33,20 +82,34 @@ class AnalysisManager:
                     "video_path": video_path
                 }
             
-            # Run in thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                video_analyzer.analyze_video_by_path,
-                video_path,
-                detailed
-            )
+            on_delta = None
+            if stream:
+                source_path = video_path
+
+                async def on_delta(text):
+                    first_token.setdefault("seconds", round(time.monotonic() - started, 3))
+                    await self._broadcast({
+                        "type": "analysis_delta",
+                        "data": {"video_path": source_path, "detailed": detailed,
+                                 "request_id": request_id, "text": text}
+                    })
+
+            if video_path.endswith("manifest.json"):
+                result, cached, complete = await self._analyze_segments(
+                    video_path, detailed, on_delta, long_video
+                )
+            else:
+                result, cached = await self._analyze_file(video_path, detailed, on_delta, long_video)
+                complete = True
 
             # Generate workflow from the analysis
             workflow_result = None
-            if result and isinstance(result, str):
+            if generate_workflow and result and not analysis_failed(result):
                 try:
-                    workflow_result = workflow_manager.generate_workflow(result)
+                    loop = asyncio.get_event_loop()
+                    workflow_result = await loop.run_in_executor(
+                        None, self._generate_workflow, result, cached
+                    )
                 except Exception as e:
                     print(f"Error generating workflow from video analysis: {e}")
 
@@ -55,9 +118,330 @@ class AnalysisManager:
                 "analysis": result,
                 "workflow": workflow_result,
                 "video_path": video_path,
-                "detailed": detailed
+                "detailed": detailed,
+                "cached": cached,
+                "complete": complete,
+                "first_token_seconds": first_token.get("seconds"),
+                "request_id": request_id
             }
         except Exception as e:
             return {"error": str(e), "success": False}
 
+    async def _analyze_file(self, video_path, detailed, on_delta=None, long_video=None):
+        """Analyze one video file, answering from the result cache when possible
+
+        on_delta receives the reply text as it streams in (all at once for
+        a cached result). Returns (result, cached).
+        """
+        loop = asyncio.get_event_loop()
+        windows = await loop.run_in_executor(None, self._long_video_windows, video_path, detailed, long_video)
+        if windows:
+            return await self._analyze_windows(video_path, windows, on_delta)
+
+        async def analyze(delta):
+            return await video_analyzer.analyze_video_by_path_async(video_path, detailed, delta)
+
+        return await self._cached_analysis(video_path, video_analyzer.cache_params(detailed), analyze, on_delta)
+
+    def _long_video_windows(self, video_path, detailed, long_video=None):
+        """Windows a detailed analysis of video_path is split into, or None if it is analyzed whole"""
+        if not detailed or long_video is False:
+            return None
+        windows = video_analyzer.plan_windows(video_path)
+        duration = windows[-1][3] if windows else 0
+        if len(windows) > 1 and (long_video or duration > LONG_VIDEO_SECONDS):
+            return windows
+        return None
+
+    def _window_params(self, window):
+        """Cache params of one window of a long recording"""
+        return {**video_analyzer.cache_params(True), "window": [window[0], window[1]]}
+
+    async def _analyze_windows(self, video_path, windows, on_delta=None):
+        """Map-reduce analysis of a long recording
+
+        Every window is analyzed (and cached) on its own, LONG_VIDEO_WORKERS
+        at a time, and the step lists are merged in time order. The merged
+        text goes to on_delta once it is complete; if any window failed it
+        is an "Analysis failed:" result, so callers treat it as a failure.
+        """
+        semaphore = asyncio.Semaphore(LONG_VIDEO_WORKERS)
+
+        async def run(part, window):
+            async def analyze(delta):
+                return await video_analyzer.analyze_window_async(video_path, window, part, len(windows))
+
+            async with semaphore:
+                return await self._cached_analysis(video_path, self._window_params(window), analyze)
+
+        outcomes = await asyncio.gather(*(run(part, window) for part, window in enumerate(windows, 1)))
+        result = video_analyzer.merge_windows(video_path, windows, [text for text, _ in outcomes])
+        if on_delta is not None:
+            await on_delta(result)
+        return result, all(cached for _, cached in outcomes)
+
+    async def _cached_analysis(self, video_path, params, analyze, on_delta=None):
+        """Result of awaiting analyze(on_delta), stored under the video's hash and params
+
+        Failed analyses are not cached. Returns (result, cached).
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            # Hashing may read the whole file; keep it off the event loop
+            content_hash = await loop.run_in_executor(None, analysis_cache.content_hash, video_path)
+            key = analysis_cache.make_key(content_hash, params)
+            cached = analysis_cache.get(key)
+        except Exception as e:
+            print(f"Analysis cache unavailable: {e}")
+            key = None
+            cached = None
+        if cached is not None:
+            if on_delta is not None:
+                await on_delta(cached)
+            return cached, True
+
+        result = await analyze(on_delta)
+        if key is not None and not analysis_failed(result):
+            try:
+                analysis_cache.put(key, content_hash, video_path, params, result)
+            except Exception as e:
+                print(f"Could not cache analysis: {e}")
+        return result, False
+
+    def _generate_workflow(self, analysis, cached):
+        """Workflow for an analysis, reused from the cache along with a cached analysis"""
+        key = analysis_cache.make_key(
+            hashlib.sha256(analysis.encode("utf-8")).hexdigest(), {"workflow": True}
+        )
+        if cached:
+            stored = analysis_cache.get(key, count=False)
+            if stored is not None:
+                return json.loads(stored)
+
+        workflow_result = workflow_manager.generate_workflow(analysis)
+        if workflow_result and workflow_result.get("success"):
+            analysis_cache.put(key, key, None, {"workflow": True}, json.dumps(workflow_result))
+        return workflow_result
+
+    async def start_batch(self, video_paths=None, detailed=False,
+                          concurrency=BATCH_CONCURRENCY, generate_workflows=False):
+        """Analyze many recordings in the background
+
+        video_paths None means every recording without a cached analysis.
+        At most concurrency recordings are in flight; the analyzer's rate
+        limiter keeps the requests within the API quota. Progress is
+        broadcast as analysis_batch_* events.
+        """
+        if concurrency < 1:
+            return {"error": "Concurrency must be at least 1", "success": False}
+        if video_paths is None:
+            video_paths = await self.unanalyzed_recordings(detailed)
+
+        batch_id = uuid.uuid4().hex[:12]
+        batch = {
+            "id": batch_id,
+            "state": "running",
+            "detailed": detailed,
+            "total": len(video_paths),
+            "completed": 0,
+            "failed": 0,
+            "cached": 0,
+            "started": time.time(),
+            "finished": None,
+            "items": [{"video_path": path, "status": "pending"} for path in video_paths]
+        }
+        self.batches[batch_id] = batch
+
+        task = asyncio.create_task(self._run_batch(batch, concurrency, generate_workflows))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+        return {"success": True, "batch_id": batch_id, "total": batch["total"]}
+
+    async def _run_batch(self, batch, concurrency, generate_workflows):
+        semaphore = asyncio.Semaphore(concurrency)
+        await self._broadcast({"type": "analysis_batch_started", "data": self._batch_summary(batch)})
+
+        async def run(index, item):
+            async with semaphore:
+                item["status"] = "running"
+                result = await self.analyze_video(
+                    item["video_path"], batch["detailed"], generate_workflow=generate_workflows
+                )
+            ok = result.get("success") and not analysis_failed(result.get("analysis"))
+            item["status"] = "done" if ok else "failed"
+            item["cached"] = bool(result.get("cached"))
+            if not ok:
+                item["error"] = result.get("error") or result.get("analysis")
+            batch["completed"] += 1
+            batch["failed"] += 0 if ok else 1
+            batch["cached"] += 1 if item["cached"] else 0
+            await self._broadcast({
+                "type": "analysis_batch_progress",
+                "data": {**self._batch_summary(batch), "index": index, "item": item,
+                         "analysis": result.get("analysis")}
+            })
+
+        await asyncio.gather(*(run(index, item) for index, item in enumerate(batch["items"])))
+        batch["state"] = "complete"
+        batch["finished"] = time.time()
+        await self._broadcast({"type": "analysis_batch_complete", "data": self._batch_summary(batch)})
+
+    def _batch_summary(self, batch):
+        return {key: value for key, value in batch.items() if key != "items"}
+
+    def get_batch(self, batch_id):
+        batch = self.batches.get(batch_id)
+        if batch is None:
+            return {"error": f"Unknown batch: {batch_id}"}
+        return batch
+
+    async def unanalyzed_recordings(self, detailed=False, recordings_dir="data/recordings"):
+        """Recordings (files and finished segmented sessions) with no cached analysis
+
+        Files the current session is still writing are left out.
+        """
+        recordings_dir = os.path.abspath(recordings_dir)
+        paths = sorted(
+            (path for path in glob(os.path.join(recordings_dir, "*.mp4"))
+             if not recording_manager.is_writing(path)),
+            key=os.path.getmtime
+        )
+        for manifest_path in sorted(glob(os.path.join(recordings_dir, "*", "manifest.json"))):
+            if load_segment_manifest(manifest_path).get("complete"):
+                paths.append(manifest_path)
+
+        loop = asyncio.get_event_loop()
+        pending = []
+        for path in paths:
+            analyzed = await loop.run_in_executor(None, self._is_analyzed, path, detailed)
+            if not analyzed:
+                pending.append(path)
+        return pending
+
+    def _is_analyzed(self, video_path, detailed):
+        """Whether every file of a recording has a cached analysis
+
+        A long recording counts once every one of its windows is cached,
+        since only the windows are stored.
+        """
+        if video_path.endswith("manifest.json"):
+            directory = os.path.dirname(video_path)
+            segments = load_segment_manifest(video_path).get("segments", [])
+            files = [os.path.join(directory, segment["file"]) for segment in segments]
+        else:
+            files = [video_path]
+        params = video_analyzer.cache_params(detailed)
+
+        def cached(f):
+            windows = self._long_video_windows(f, detailed)
+            keyed = [self._window_params(window) for window in windows] if windows else [params]
+            content_hash = analysis_cache.content_hash(f)
+            return all(
+                analysis_cache.get(analysis_cache.make_key(content_hash, p), count=False) is not None
+                for p in keyed
+            )
+
+        try:
+            return bool(files) and all(cached(f) for f in files)
+        except OSError:
+            return False
+
+    def get_cache_stats(self):
+        return {"results": analysis_cache.stats(), "frames": frame_cache.stats()}
+
+    def get_payload_metrics(self):
+        return video_analyzer.payload_metrics()
+
+    async def get_thumbnail(self, video_path, width=320):
+        """JPEG thumbnail of a recording, served from the frame cache after the first request"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, video_analyzer.get_thumbnail, video_path, width)
+
+    async def _analyze_segments(self, manifest_path, detailed, on_delta=None, long_video=None,
+                                poll_interval=1.0):
+        """Analyze segments as they are finished until the recording completes
+
+        Finished segments go through the result cache, so a recording
+        analyzed while it was still running only pays for new segments.
+        Without streaming, the segments finished so far are analyzed
+        LONG_VIDEO_WORKERS at a time. Returns (result, cached, complete)
+        where cached means every segment was and complete that the manifest
+        was finished. If any segment failed, result starts with an
+        "Analysis failed:" line naming those segments.
+
+        While this backend is still recording the session, the analysis
+        waits for it however long a segment takes, since a static screen
+        writes no frames and so does not roll segments. A recording made
+        elsewhere is given up on once no segment appears for three segment
+        lengths.
+        """
+        directory = os.path.dirname(manifest_path)
+        sections = []
+        failed = []
+        all_cached = True
+        last_progress = time.monotonic()
+        semaphore = asyncio.Semaphore(LONG_VIDEO_WORKERS)
+
+        def header_for(segments, index):
+            segment = segments[index]
+            offset = segment["start_time"] - segments[0]["start_time"]
+            span = f"{format_offset(offset)} - {format_offset(offset + segment['duration'])}"
+            return f"## Segment {index + 1} ({span})\n\n"
+
+        async def analyze(segment):
+            async with semaphore:
+                return await self._analyze_file(
+                    os.path.join(directory, segment["file"]), detailed, long_video=long_video
+                )
+
+        while True:
+            manifest = load_segment_manifest(manifest_path)
+            segments = manifest.get("segments", [])
+            new = range(len(sections), len(segments))
+
+            if on_delta is not None:
+                # Streamed text has to arrive in order, one segment at a time
+                for index in new:
+                    header = header_for(segments, index)
+                    await on_delta(("\n\n" if sections else "") + header)
+                    segment_path = os.path.join(directory, segments[index]["file"])
+                    result, cached = await self._analyze_file(segment_path, detailed, on_delta, long_video)
+                    all_cached = all_cached and cached
+                    if analysis_failed(result):
+                        failed.append(index + 1)
+                    sections.append(f"{header}{result}")
+            else:
+                outcomes = await asyncio.gather(*(analyze(segments[index]) for index in new))
+                for index, (result, cached) in zip(new, outcomes):
+                    all_cached = all_cached and cached
+                    if analysis_failed(result):
+                        failed.append(index + 1)
+                    sections.append(f"{header_for(segments, index)}{result}")
+            if new:
+                last_progress = time.monotonic()
+
+            complete = bool(manifest.get("complete"))
+            if complete:
+                break
+
+            if recording_manager.is_writing(manifest_path):
+                last_progress = time.monotonic()
+            elif time.monotonic() - last_progress > 3 * manifest.get("segment_seconds", 60):
+                print(f"Segmented recording stalled: {manifest_path}")
+                break
+            await asyncio.sleep(poll_interval)
+
+        if not sections:
+            return "Analysis failed: no finished segments to analyze", False, complete
+        result = "\n\n".join(sections)
+        if failed:
+            # Same shape as a long recording with failed windows, so
+            # analysis_failed() sees the failure behind the segment headers
+            result = (
+                f"Analysis failed: {len(failed)} of {len(sections)} segments could not be analyzed "
+                f"({', '.join(f'segment {number}' for number in failed)})\n\n{result}"
+            )
+        return result, all_cached, complete
+
 analysis_manager = AnalysisManager()
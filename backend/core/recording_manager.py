@@ -3,85 +3,462 @@ Recording Manager - Handles screen recording operations
 """
 
 import os
+import json
+import time
 import asyncio
+import mss
 from threading import Thread, Event
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Optional
 import sys
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
-from recorder import record_screen
+from recorder import (
+    record_screen, RecordingStats, segment_manifest_path, load_segment_manifest, load_frame_index
+)
+from encoders import encoder_available, encoder_options_error
+from replay_buffer import ReplayBuffer
 from utils import timestamped_filename
 
 
+# Head start given to the capture threads so every monitor hits its first
+# frame deadline together
+SYNC_START_DELAY = 0.5
+
+# Upper bound for waiting on encoders to flush after stop
+FINALIZE_TIMEOUT = 120
+
+# How often a running session checks that its recorder threads are alive
+WATCH_INTERVAL = 1.0
+
+
 class RecordingManager:
     """Manages screen recording operations"""
 
     def __init__(self):
         self.recording = False
-        self.record_thread = None
+        self.state = "idle"  # "recording", "finalizing" or "idle"
+        self.ws_broadcast: Optional[Callable] = None
         self.stop_event = None
         self.current_filename = None
+        self.session_manifest = None
+        self.pipelines = []
+        self.options = {}
+        self._finalize_tasks = set()
+        self._watch_task = None
+
+    def set_ws_broadcast(self, broadcast_fn: Callable):
+        """Set WebSocket broadcast function for finalization events"""
+        self.ws_broadcast = broadcast_fn
+
+    async def start_recording(self, fps=3, pipelined=True, queue_size=8,
+                              skip_unchanged=False, change_threshold=1.0,
+                              segment_seconds=None, catch_up="skip",
+                              encoder="opencv", encoder_options=None,
+                              monitors=None, replay_minutes=None,
+                              replay_max_mb=256, replay_quality=80,
+                              adaptive_fps=False, min_fps=1, max_fps=10,
+                              idle_pause_seconds=None, heartbeat_fps=None,
+                              capture_region=None, capture_scale=None, capture_size=None,
+                              encoder_process=False):
+        """Start screen recording
+
+        ``monitors`` is None for the primary monitor, "all", or a list of
+        mss monitor indices; each monitor gets its own capture pipeline.
 
-    async def start_recording(self):
-        """Start screen recording"""
+        ``capture_region`` (relative to each monitor), ``capture_scale`` and
+        ``capture_size`` limit what is grabbed and the output resolution.
+
+        ``encoder_process`` moves encoding to a worker process fed through
+        shared memory; its queue depth and health show up in the status.
+
+        With ``replay_minutes`` set nothing is written to disk: the last
+        minutes of frames are kept in a memory-capped ring per monitor
+        until ``save_replay`` is called.
+        """
         if self.recording:
             return {"error": "Recording already in progress", "recording": True}
+        if self.state == "finalizing":
+            # The previous encoders are still flushing their files
+            return {"error": "Previous recording is still being finalized", "recording": False}
+        if not fps > 0:
+            return {"error": "Frame rate must be greater than 0", "recording": False}
+        if heartbeat_fps is not None and not heartbeat_fps > 0:
+            return {"error": "Heartbeat frame rate must be greater than 0", "recording": False}
+        if (pipelined or encoder_process) and not queue_size >= 1:
+            # An empty pool would drop every frame
+            return {"error": "Queue size must be at least 1", "recording": False}
+        if capture_size is not None and (len(capture_size) != 2 or not min(capture_size) > 0):
+            return {"error": "Capture size must be [width, height] with both greater than 0",
+                    "recording": False}
+        if catch_up not in ("skip", "burst"):
+            return {"error": f"Unknown catch-up policy: {catch_up}", "recording": False}
+        if adaptive_fps and not 0 < min_fps <= max_fps:
+            return {"error": "Adaptive frame rate needs 0 < min_fps <= max_fps", "recording": False}
+        if capture_scale is not None and not 0 < capture_scale <= 1:
+            return {"error": "Capture scale must be in (0, 1]", "recording": False}
+        if encoder_process and replay_minutes:
+            return {"error": "Replay buffers are filled in-process; disable encoder_process", "recording": False}
+        if not encoder_available(encoder):
+            return {"error": f"Encoder not available: {encoder}", "recording": False}
+        options_error = encoder_options_error(encoder, encoder_options)
+        if options_error:
+            return {"error": options_error, "recording": False}
+        try:
+            selected = self._select_monitors(monitors)
+        except ValueError as e:
+            return {"error": str(e), "recording": False}
 
         # Ensure recordings directory exists
         recordings_dir = os.path.abspath("data/recordings")
         os.makedirs(recordings_dir, exist_ok=True)
-        
-        # Generate filename with absolute path for persistence
-        filename = f"{timestamped_filename()}.mp4"
-        self.current_filename = os.path.join(recordings_dir, filename)
+
+        # Generate filenames with absolute path for persistence
+        base = os.path.join(recordings_dir, timestamped_filename())
         self.stop_event = Event()
+        self.options = {
+            "fps": fps,
+            "pipelined": pipelined,
+            "queue_size": queue_size,
+            "skip_unchanged": skip_unchanged,
+            "change_threshold": change_threshold,
+            "segment_seconds": segment_seconds,
+            "catch_up": catch_up,
+            "encoder": encoder,
+            "encoder_options": encoder_options or {},
+            "adaptive_fps": adaptive_fps,
+            "min_fps": min_fps,
+            "max_fps": max_fps,
+            "idle_pause_seconds": idle_pause_seconds,
+            "heartbeat_fps": heartbeat_fps,
+            "capture_region": capture_region,
+            "capture_scale": capture_scale,
+            "capture_size": capture_size,
+            "encoder_process": encoder_process,
+            "monitors": [index for index, _ in selected],
+            "replay_minutes": replay_minutes,
+            "replay_max_mb": replay_max_mb,
+            "replay_quality": replay_quality
+        }
+        record_options = {
+            key: value for key, value in self.options.items()
+            if key not in ("fps", "monitors") and not key.startswith("replay_")
+        }
 
-        # Start recording in background thread
-        self.record_thread = Thread(
-            target=record_screen,
-            args=(self.current_filename, 3, self.stop_event),
-            daemon=True
-        )
-        self.record_thread.start()
+        start_at = time.monotonic() + SYNC_START_DELAY
+        start_time = time.time() + SYNC_START_DELAY
+
+        self.pipelines = []
+        for index, geometry in selected:
+            filename = f"{base}.mp4" if len(selected) == 1 else f"{base}_mon{index}.mp4"
+            stats = RecordingStats()
+            replay = None
+            if replay_minutes:
+                # Memory budget is split evenly across monitors
+                replay = ReplayBuffer(
+                    replay_minutes * 60,
+                    max_bytes=int(replay_max_mb * 1024 * 1024 / len(selected)),
+                    quality=replay_quality
+                )
+            # Each monitor records in its own thread
+            thread = Thread(
+                target=record_screen,
+                args=(filename, fps, self.stop_event),
+                kwargs={
+                    **record_options,
+                    "stats": stats,
+                    "monitor_index": index,
+                    "start_at": start_at,
+                    "writer": replay
+                },
+                daemon=True
+            )
+            self.pipelines.append({
+                "monitor": index,
+                "geometry": geometry,
+                "filename": filename,
+                "thread": thread,
+                "stats": stats,
+                "replay": replay
+            })
+
+        self.current_filename = self.pipelines[0]["filename"]
+        self.session_manifest = None
+        if len(self.pipelines) > 1 and not replay_minutes:
+            self.session_manifest = f"{base}.session.json"
+            self._write_session_manifest(start_time)
+
+        for pipeline in self.pipelines:
+            pipeline["thread"].start()
         self.recording = True
+        self.state = "recording"
+        self._watch_task = asyncio.create_task(self._watch(self.pipelines))
 
         return {
             "success": True,
             "recording": True,
             "filename": os.path.basename(self.current_filename),
+            "files": [os.path.basename(p["filename"]) for p in self.pipelines],
+            "session_manifest": self.session_manifest,
+            "manifest": self._manifest_path(),
+            "replay": bool(replay_minutes),
             "timestamp": datetime.now().isoformat()
         }
 
     async def stop_recording(self):
-        """Stop screen recording"""
+        """Stop screen recording
+
+        Returns as soon as capture is signalled to stop. Encoders flush in
+        the background and a "recording_finalized" event with the final
+        file stats is broadcast once every writer has been released.
+        """
         if not self.recording or not self.stop_event:
             return {"error": "No active recording", "recording": False}
 
         self.stop_event.set()
-        if self.record_thread:
-            self.record_thread.join(timeout=5)
 
         filename = os.path.basename(self.current_filename) if self.current_filename else None
+        result = {
+            "filename": filename,
+            "files": [os.path.basename(p["filename"]) for p in self.pipelines],
+            "session_manifest": self.session_manifest,
+            "manifest": self._manifest_path()
+        }
         self.recording = False
+        self.state = "finalizing"
         self.current_filename = None
 
+        task = asyncio.create_task(self._finalize(self.pipelines, dict(result), dict(self.options)))
+        self._finalize_tasks.add(task)
+        task.add_done_callback(self._finalize_tasks.discard)
+
         return {
             "success": True,
             "recording": False,
-            "filename": filename,
+            "state": "finalizing",
+            **result,
+            "frames": self._frame_totals(),
             "timestamp": datetime.now().isoformat()
         }
 
+    async def _finalize(self, pipelines, result, options):
+        """Wait for the recorder threads off the event loop, then report
+
+        options are those the pipelines were started with.
+        """
+        loop = asyncio.get_event_loop()
+        for pipeline in pipelines:
+            await loop.run_in_executor(None, pipeline["thread"].join, FINALIZE_TIMEOUT)
+
+        result["finalized"] = not any(p["thread"].is_alive() for p in pipelines)
+        result["files"] = [self._file_stats(p, options) for p in pipelines]
+        result["timestamp"] = datetime.now().isoformat()
+        self.state = "idle"
+
+        if self.ws_broadcast:
+            try:
+                await self.ws_broadcast({
+                    "type": "recording_finalized",
+                    "data": result
+                })
+            except Exception as e:
+                print(f"Error broadcasting recording finalization: {e}")
+
+    async def _watch(self, pipelines):
+        """Stop the session and report when a recorder thread ends on its own
+
+        A recorder that fails (such as a dead encoder process) would
+        otherwise leave the session reported as recording while nothing is
+        written. The stop is broadcast as "recording_stopped" with the error.
+        """
+        while self.recording and self.pipelines is pipelines:
+            ended = [p for p in pipelines if not p["thread"].is_alive()]
+            if ended:
+                errors = [
+                    {"monitor": p["monitor"],
+                     "error": p["stats"].snapshot().get("error") or "Recorder stopped unexpectedly"}
+                    for p in ended
+                ]
+                print(f"Recording stopped after a recorder failed: {errors}")
+                result = await self.stop_recording()
+                result["error"] = "; ".join(error["error"] for error in errors)
+                result["errors"] = errors
+                if self.ws_broadcast:
+                    try:
+                        await self.ws_broadcast({"type": "recording_stopped", "data": result})
+                    except Exception as e:
+                        print(f"Error broadcasting recording failure: {e}")
+                return
+            await asyncio.sleep(WATCH_INTERVAL)
+
+    def _file_stats(self, pipeline, options):
+        """Frames, duration and size of a finished pipeline's output"""
+        frames = pipeline["stats"].snapshot()["frames_encoded"]
+        fps = options.get("fps") or 1
+        path = pipeline["filename"]
+        info = {
+            "monitor": pipeline["monitor"],
+            "filename": os.path.basename(path),
+            "frames": frames,
+            "duration": round(frames / fps, 3),
+            "size": None
+        }
+
+        if pipeline["replay"]:
+            # Replay frames stay in memory until saved
+            return info
+
+        manifest_path = segment_manifest_path(path)
+        if os.path.exists(manifest_path):
+            segments = load_segment_manifest(manifest_path).get("segments", [])
+            directory = os.path.dirname(manifest_path)
+            info["size"] = sum(
+                os.path.getsize(os.path.join(directory, seg["file"]))
+                for seg in segments
+                if os.path.exists(os.path.join(directory, seg["file"]))
+            )
+            info["duration"] = round(sum(seg["duration"] for seg in segments), 3)
+            return info
+
+        if os.path.exists(path):
+            info["size"] = os.path.getsize(path)
+        index = load_frame_index(path)
+        if index and index["frames"]:
+            # Real span, which differs from frames / fps when frames were skipped
+            info["duration"] = round(index["frames"][-1][1] + 1.0 / fps, 3)
+        return info
+
     async def get_status(self):
         """Get current recording status"""
         return {
             "recording": self.recording,
-            "current_file": os.path.basename(self.current_filename) if self.current_filename else None
+            "state": self.state,
+            "current_file": os.path.basename(self.current_filename) if self.current_filename else None,
+            "session_manifest": self.session_manifest,
+            "manifest": self._manifest_path(),
+            "options": self.options,
+            "frames": self._frame_totals(),
+            "monitors": [
+                {
+                    "monitor": p["monitor"],
+                    "file": os.path.basename(p["filename"]),
+                    "frames": p["stats"].snapshot(),
+                    "replay": p["replay"].stats() if p["replay"] else None
+                }
+                for p in self.pipelines
+            ]
         }
 
+    async def save_replay(self, seconds=None):
+        """Flush the replay buffers to MP4 files without pausing capture"""
+        buffers = [p for p in self.pipelines if p["replay"]]
+        if not buffers:
+            return {"error": "Replay buffer is not active", "success": False}
+
+        recordings_dir = os.path.abspath("data/recordings")
+        os.makedirs(recordings_dir, exist_ok=True)
+        base = os.path.join(recordings_dir, timestamped_filename().replace("recording_", "replay_"))
+
+        # Decoding and re-encoding happens on executor threads; the capture
+        # threads only contend for the ring lock while it is copied
+        loop = asyncio.get_event_loop()
+        saved = []
+        for pipeline in buffers:
+            path = f"{base}.mp4" if len(buffers) == 1 else f"{base}_mon{pipeline['monitor']}.mp4"
+            result = await loop.run_in_executor(
+                None,
+                lambda p=pipeline, path=path: p["replay"].save(
+                    path,
+                    self.options["fps"],
+                    seconds=seconds,
+                    encoder=self.options["encoder"],
+                    encoder_options=self.options["encoder_options"]
+                )
+            )
+            if result:
+                result["filename"] = os.path.basename(path)
+                result["monitor"] = pipeline["monitor"]
+                saved.append(result)
+
+        if not saved:
+            return {"error": "Replay buffer is empty", "success": False}
+        return {
+            "success": True,
+            "files": saved,
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def _select_monitors(self, monitors):
+        """Resolve a monitor selection to (index, geometry) pairs"""
+        with mss.mss() as sct:
+            available = sct.monitors
+        if monitors is None:
+            indices = [1]
+        elif monitors == "all":
+            indices = list(range(1, len(available)))
+        else:
+            indices = list(dict.fromkeys(int(i) for i in monitors))
+        for index in indices:
+            if index < 1 or index >= len(available):
+                raise ValueError(f"Monitor {index} not found ({len(available) - 1} available)")
+        if not indices:
+            raise ValueError("No monitors selected")
+        return [(index, dict(available[index])) for index in indices]
+
+    def _write_session_manifest(self, start_time):
+        """Describe a multi-monitor session so its files can be lined up later"""
+        with open(self.session_manifest, "w", encoding="utf-8") as f:
+            json.dump({
+                "session": os.path.basename(self.session_manifest).replace(".session.json", ""),
+                "start_time": start_time,
+                "fps": self.options["fps"],
+                "segment_seconds": self.options["segment_seconds"],
+                "monitors": [
+                    {
+                        "monitor": p["monitor"],
+                        "file": os.path.basename(p["filename"]),
+                        "left": p["geometry"]["left"],
+                        "top": p["geometry"]["top"],
+                        "width": p["geometry"]["width"],
+                        "height": p["geometry"]["height"]
+                    }
+                    for p in self.pipelines
+                ]
+            }, f, indent=2)
+
+    def _frame_totals(self):
+        """Frame counters summed over all monitor pipelines"""
+        if not self.pipelines:
+            return None
+        snapshots = [p["stats"].snapshot() for p in self.pipelines]
+        if len(snapshots) == 1:
+            return snapshots[0]
+        totals = {}
+        for snapshot in snapshots:
+            for key, value in snapshot.items():
+                if isinstance(value, int):
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def is_writing(self, path):
+        """Whether the current session, recording or finalizing, writes this video or segment manifest"""
+        if self.state == "idle":
+            return False
+        target = os.path.abspath(path)
+        return any(
+            target in (os.path.abspath(p["filename"]), os.path.abspath(segment_manifest_path(p["filename"])))
+            for p in self.pipelines
+        )
+
+    def _manifest_path(self):
+        """Manifest of the current recording, if it is segmented"""
+        if not self.current_filename or not self.options.get("segment_seconds"):
+            return None
+        return segment_manifest_path(self.current_filename)
+
     async def list_recordings(self):
         """List all recordings"""
         recordings_dir = os.path.abspath("data/recordings")
@@ -89,7 +466,30 @@ class RecordingManager:
 
         recordings = []
         for filename in os.listdir(recordings_dir):
-            if filename.endswith('.mp4'):
+            manifest_path = os.path.join(recordings_dir, filename, "manifest.json")
+            if os.path.isfile(manifest_path):
+                # Segmented recording: list the session rather than each part
+                try:
+                    manifest = load_segment_manifest(manifest_path)
+                except (OSError, ValueError):
+                    continue
+                stat = os.stat(manifest_path)
+                segments = manifest.get("segments", [])
+                recordings.append({
+                    "filename": filename,
+                    "path": os.path.abspath(manifest_path),
+                    "segmented": True,
+                    "segments": len(segments),
+                    "complete": manifest.get("complete", False),
+                    "size": sum(
+                        os.path.getsize(os.path.join(recordings_dir, filename, seg["file"]))
+                        for seg in segments
+                        if os.path.exists(os.path.join(recordings_dir, filename, seg["file"]))
+                    ),
+                    "created": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+                    "modified": datetime.fromtimestamp(stat.st_mtime).isoformat()
+                })
+            elif filename.endswith('.mp4'):
                 filepath = os.path.join(recordings_dir, filename)
                 # Use absolute path for persistence
                 abs_filepath = os.path.abspath(filepath)
@@ -5,9 +5,9 @@ Modern REST API + WebSocket server for Electron frontend
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Any, Union
 import uvicorn
 import asyncio
 import json
@@ -79,6 +79,8 @@ async def voice_broadcast(message: dict):
     await manager.broadcast(message)
 
 voice_assistant_manager.set_ws_broadcast(voice_broadcast)
+recording_manager.set_ws_broadcast(manager.broadcast)
+analysis_manager.set_ws_broadcast(manager.broadcast)
 
 
 # Pydantic models
@@ -87,9 +89,48 @@ class RecordingControl(BaseModel):
     filename: Optional[str] = None
 
 
+class RecordingOptions(BaseModel):
+    fps: float = 3
+    pipelined: bool = True
+    queue_size: int = 8
+    skip_unchanged: bool = False
+    change_threshold: float = 1.0
+    segment_seconds: Optional[float] = None
+    catch_up: str = "skip"  # "skip" or "burst"
+    encoder: str = "opencv"  # "opencv" or "ffmpeg"
+    encoder_options: Optional[Dict[str, Any]] = None  # e.g. {"preset": "ultrafast", "crf": 28}
+    monitors: Optional[Union[str, List[int]]] = None  # None = primary, "all", or [1, 2]
+    replay_minutes: Optional[float] = None  # keep frames in memory instead of writing a file
+    replay_max_mb: float = 256
+    replay_quality: int = 80
+    adaptive_fps: bool = False  # follow on-screen activity between min_fps and max_fps
+    min_fps: float = 1
+    max_fps: float = 10
+    idle_pause_seconds: Optional[float] = None  # pause encoding after this long without change
+    heartbeat_fps: Optional[float] = None  # slower grab rate while paused
+    capture_region: Optional[Dict[str, int]] = None  # {"left", "top", "width", "height"} within the monitor
+    capture_scale: Optional[float] = None  # e.g. 0.5 for half resolution
+    capture_size: Optional[List[int]] = None  # [width, height] to fit inside
+    encoder_process: bool = False  # encode in a worker process fed through shared memory
+
+
+class ReplaySaveRequest(BaseModel):
+    seconds: Optional[float] = None  # defaults to the whole buffer
+
+
 class AnalysisRequest(BaseModel):
     video_path: str
     detailed: bool = False
+    stream: bool = False  # broadcast analysis_delta events while the reply is generated
+    long_video: Optional[bool] = None  # split into time windows; None = only long recordings
+    request_id: Optional[str] = None  # echoed in analysis_delta events so clients can match them
+
+
+class BatchAnalysisRequest(BaseModel):
+    video_paths: Optional[List[str]] = None  # None = every recording not analyzed yet
+    detailed: bool = False
+    concurrency: int = 4
+    generate_workflows: bool = False
 
 
 class VoiceMessage(BaseModel):
@@ -122,10 +163,34 @@ async def health_check():
 # ===== Recording Endpoints =====
 
 @app.post("/api/recording/start")
-async def start_recording():
+async def start_recording(options: Optional[RecordingOptions] = None):
     """Start screen recording"""
+    options = options or RecordingOptions()
     try:
-        result = await recording_manager.start_recording()
+        result = await recording_manager.start_recording(
+            fps=options.fps,
+            pipelined=options.pipelined,
+            queue_size=options.queue_size,
+            skip_unchanged=options.skip_unchanged,
+            change_threshold=options.change_threshold,
+            segment_seconds=options.segment_seconds,
+            catch_up=options.catch_up,
+            encoder=options.encoder,
+            encoder_options=options.encoder_options,
+            monitors=options.monitors,
+            replay_minutes=options.replay_minutes,
+            replay_max_mb=options.replay_max_mb,
+            replay_quality=options.replay_quality,
+            adaptive_fps=options.adaptive_fps,
+            min_fps=options.min_fps,
+            max_fps=options.max_fps,
+            idle_pause_seconds=options.idle_pause_seconds,
+            heartbeat_fps=options.heartbeat_fps,
+            capture_region=options.capture_region,
+            capture_scale=options.capture_scale,
+            capture_size=options.capture_size,
+            encoder_process=options.encoder_process
+        )
         await manager.broadcast({
             "type": "recording_started",
             "data": result
@@ -149,6 +214,23 @@ async def stop_recording():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/recording/replay/save")
+async def save_replay(request: Optional[ReplaySaveRequest] = None):
+    """Save the replay buffer to a recording"""
+    try:
+        result = await recording_manager.save_replay(
+            seconds=request.seconds if request else None
+        )
+        if result.get("success"):
+            await manager.broadcast({
+                "type": "replay_saved",
+                "data": result
+            })
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/api/recording/status")
 async def get_recording_status():
     """Get current recording status"""
@@ -224,7 +306,9 @@ async def quick_analysis(request: AnalysisRequest):
 
         result = await analysis_manager.analyze_video(
             request.video_path,
-            detailed=False
+            detailed=False,
+            stream=request.stream,
+            request_id=request.request_id
         )
 
         await manager.broadcast({
@@ -276,7 +360,10 @@ async def detailed_analysis(request: AnalysisRequest):
 
         result = await analysis_manager.analyze_video(
             request.video_path,
-            detailed=True
+            detailed=True,
+            stream=request.stream,
+            long_video=request.long_video,
+            request_id=request.request_id
         )
 
         # Broadcast workflow if available
@@ -296,6 +383,41 @@ async def detailed_analysis(request: AnalysisRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/analysis/batch")
+async def batch_analysis(request: BatchAnalysisRequest):
+    """Analyze many recordings in the background; progress is sent over the WebSocket"""
+    result = await analysis_manager.start_batch(
+        video_paths=request.video_paths,
+        detailed=request.detailed,
+        concurrency=request.concurrency,
+        generate_workflows=request.generate_workflows
+    )
+    if "error" in result:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+
+@app.get("/api/analysis/batch/{batch_id}")
+async def get_batch_analysis(batch_id: str):
+    """Get the progress of a batch analysis"""
+    result = analysis_manager.get_batch(batch_id)
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
+
+
+@app.get("/api/analysis/cache")
+async def get_analysis_cache_stats():
+    """Get analysis result and frame cache statistics"""
+    return analysis_manager.get_cache_stats()
+
+
+@app.get("/api/analysis/metrics")
+async def get_analysis_payload_metrics():
+    """Get bytes, image tokens and latency of recent analysis requests"""
+    return analysis_manager.get_payload_metrics()
+
+
 # ===== Voice Assistant Endpoints =====
 
 @app.post("/api/voice/start")
@@ -363,6 +485,18 @@ async def get_recording_file(filename: str):
     return FileResponse(file_path)
 
 
+@app.get("/api/files/recordings/{filename}/thumbnail")
+async def get_recording_thumbnail(filename: str, width: int = 320):
+    """Get a JPEG thumbnail of a recording"""
+    file_path = os.path.join("data", "recordings", filename)
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail="File not found")
+    thumbnail = await analysis_manager.get_thumbnail(file_path, width)
+    if thumbnail is None:
+        raise HTTPException(status_code=422, detail="Could not read a frame from the recording")
+    return Response(content=thumbnail, media_type="image/jpeg")
+
+
 @app.get("/api/files/screenshots/{filename}")
 async def get_screenshot_file(filename: str):
     """Download a screenshot file"""
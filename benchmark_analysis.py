@@ -0,0 +1,343 @@
+"""
+Benchmarks for the video analysis path.
+
+Runs without an API key: recordings are generated from SyntheticFrameSource
+and API calls go to a local mock server, so only the local work (decoding,
+frame preparation, HTTP overhead) is measured.
+
+    python benchmark_analysis.py extraction --lengths 20 200 1000 --frames 3 5
+    python benchmark_analysis.py client --calls 50 --handshake-ms 30
+    python benchmark_analysis.py streaming --tokens 1500 --token-ms 10
+    python benchmark_analysis.py payload --sizes 1920x1080 3840x2160 --frames 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import cv2
+import numpy as np
+import requests
+
+from claude_api import EXTRACTION_MODES, RateLimiter, VideoAnalyzer, read_frames
+from encoders import ENCODERS, create_encoder, encoder_available
+from frame_sources import SyntheticFrameSource
+from image_payload import IMAGE_FORMATS, estimate_tokens, prepare_images
+
+
+def make_recording(path, seconds, fps=3, size=(1280, 720), encoder="opencv"):
+    """Write a synthetic recording of ``seconds`` at ``fps`` and return its frame count."""
+    source = SyntheticFrameSource(size[0], size[1], pattern="window")
+    frame = np.empty((size[1], size[0], 3), dtype=np.uint8)
+    frames = int(seconds * fps)
+    out = create_encoder(encoder, path, fps, size)
+    for _ in range(frames):
+        out.write(source.grab_into(frame))
+    out.release()
+    return frames
+
+
+def even_indices(total_frames, num_frames):
+    """The analyzer's default selection when there is no frame index."""
+    return [int(i * total_frames / (num_frames + 1)) for i in range(1, num_frames + 1)]
+
+
+def time_extraction(path, indices, mode, repeats):
+    """Best wall time in ms of reading ``indices`` with ``mode``."""
+    best = None
+    for _ in range(repeats):
+        cap = cv2.VideoCapture(path)
+        start = time.perf_counter()
+        read_frames(cap, indices, mode)
+        elapsed = time.perf_counter() - start
+        cap.release()
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def bench_extraction(args):
+    print(f"{args.fps} fps recordings at {args.width}x{args.height}, encoder={args.encoder}")
+    columns = " ".join(f"{mode + ' ms':>14}" for mode in EXTRACTION_MODES)
+    print(f"{'seconds':>8} {'frames':>7} {'picked':>7} {columns}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in args.lengths:
+            path = os.path.join(tmp, f"{seconds}s.mp4")
+            total = make_recording(path, seconds, args.fps, (args.width, args.height), args.encoder)
+            for num_frames in args.frames:
+                indices = even_indices(total, num_frames)
+                times = [time_extraction(path, indices, mode, args.repeats) for mode in EXTRACTION_MODES]
+                print(f"{seconds:>8} {total:>7} {num_frames:>7} " + " ".join(f"{t:>14.1f}" for t in times))
+
+
+class MockMessagesServer(ThreadingHTTPServer):
+    """Local stand-in for the Messages API that counts new connections.
+
+    ``handshake`` seconds are spent on every new connection, like a TLS
+    handshake would, and ``latency`` seconds on every request. Replies are
+    ``tokens`` words generated ``token_time`` seconds apart, sent as
+    server-sent events when the request asks for a stream. Usage is
+    reported like the API does, with a system prompt marked for caching
+    counted as a cache write the first time and a cache read after that
+    (token counts are rough: 4 characters per token).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, handshake=0.0, latency=0.0, tokens=1, token_time=0.0):
+        super().__init__(("127.0.0.1", 0), MockMessagesHandler)
+        self.handshake = handshake
+        self.latency = latency
+        self.tokens = tokens
+        self.token_time = token_time
+        self.connections = 0
+        self.cached_prompts = set()
+        self._lock = Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1/messages"
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def usage(self, request):
+        system = request.get("system") or []
+        cacheable = json.dumps(system) if any("cache_control" in block for block in system) else ""
+        with self._lock:
+            cached = cacheable in self.cached_prompts
+            self.cached_prompts.add(cacheable)
+        prompt_tokens = len(cacheable) // 4
+        return {
+            "input_tokens": len(json.dumps(request.get("messages", []))) // 4,
+            "cache_creation_input_tokens": 0 if cached else prompt_tokens,
+            "cache_read_input_tokens": prompt_tokens if cached else 0,
+            "output_tokens": self.tokens,
+        }
+
+
+class MockMessagesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, delayed
+    # ACKs add ~40 ms to every request on a reused connection
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count_connection()
+        time.sleep(self.server.handshake)
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.server.latency)
+        usage = self.server.usage(request)
+        if request.get("stream"):
+            self.stream_reply(usage)
+            return
+
+        time.sleep(self.server.tokens * self.server.token_time)
+        text = " ".join(["ok"] * self.server.tokens)
+        body = json.dumps({"content": [{"type": "text", "text": text}], "usage": usage}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_reply(self, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        self.send_event("message_start", {"type": "message_start",
+                                          "message": {"usage": {**usage, "output_tokens": 1}}})
+        for i in range(self.server.tokens):
+            time.sleep(self.server.token_time)
+            delta = {"type": "text_delta", "text": ("" if i == 0 else " ") + "ok"}
+            self.send_event("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta})
+        self.send_event("message_delta", {"type": "message_delta",
+                                          "usage": {"output_tokens": usage["output_tokens"]}})
+        self.send_event("message_stop", {"type": "message_stop"})
+
+    def send_event(self, event, data):
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def mock_analyzer(server):
+    """VideoAnalyzer pointed at the mock server, without the client-side quota."""
+    analyzer = VideoAnalyzer(api_key="benchmark")
+    analyzer.api_url = server.url
+    analyzer.rate_limiter = RateLimiter(per_minute=1e9, burst=1e9)
+    return analyzer
+
+
+def client_runs(analyzer, payload, calls, concurrency):
+    """(label, callable) per HTTP strategy; each callable makes ``calls`` requests."""
+
+    def bare():
+        # Previous behaviour: a new connection for every request
+        for _ in range(calls):
+            requests.post(analyzer.api_url, headers=analyzer.headers, json=payload, timeout=30)
+
+    def bare_threads():
+        # Previous backend behaviour: bare requests on executor threads
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(lambda _: requests.post(
+                analyzer.api_url, headers=analyzer.headers, json=payload, timeout=30
+            ), range(calls)))
+
+    def session():
+        for _ in range(calls):
+            analyzer.send(payload, 30)
+
+    def session_threads():
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(lambda _: analyzer.send(payload, 30), range(calls)))
+
+    async def gather():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                return await analyzer.send_async(payload, 30)
+
+        await asyncio.gather(*(one() for _ in range(calls)))
+        await analyzer.aclose()
+
+    return [
+        ("requests.post", bare),
+        (f"requests.post x{concurrency} threads", bare_threads),
+        ("session", session),
+        (f"session x{concurrency} threads", session_threads),
+        (f"async x{concurrency}", lambda: asyncio.run(gather())),
+    ]
+
+
+def bench_client(args):
+    server = MockMessagesServer(args.handshake_ms / 1000, args.latency_ms / 1000)
+    Thread(target=server.serve_forever, daemon=True).start()
+    analyzer = mock_analyzer(server)
+    payload = {"model": "mock", "max_tokens": 1, "messages": [{"role": "user", "content": "hi"}]}
+
+    print(f"{args.calls} calls, {args.handshake_ms} ms per new connection, "
+          f"{args.latency_ms} ms per request")
+    print(f"{'client':<28} {'total s':>8} {'ms/call':>8} {'connections':>12}")
+    try:
+        for label, run in client_runs(analyzer, payload, args.calls, args.concurrency):
+            before = server.connections
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<28} {elapsed:>8.2f} {elapsed / args.calls * 1000:>8.1f} "
+                  f"{server.connections - before:>12}")
+    finally:
+        server.shutdown()
+
+
+def bench_streaming(args):
+    server = MockMessagesServer(0.0, args.latency_ms / 1000, args.tokens, args.token_ms / 1000)
+    Thread(target=server.serve_forever, daemon=True).start()
+    analyzer = mock_analyzer(server)
+    payload = {"model": "mock", "max_tokens": args.tokens, "messages": [{"role": "user", "content": "hi"}]}
+
+    async def measure(stream):
+        start = time.perf_counter()
+        first = []
+
+        async def on_delta(text):
+            if not first:
+                first.append(time.perf_counter() - start)
+
+        if stream:
+            text = await analyzer.send_stream_async(payload, 120, on_delta)
+        else:
+            text = await analyzer.send_async(payload, 120)
+            await on_delta(text)
+        total = time.perf_counter() - start
+        await analyzer.aclose()
+        return first[0], total, len(text.split())
+
+    print(f"{args.tokens} tokens, {args.token_ms} ms per token, {args.latency_ms} ms before the first")
+    print(f"{'mode':<10} {'first text s':>13} {'complete s':>11} {'words':>6}")
+    try:
+        for label, stream in (("blocking", False), ("streaming", True)):
+            first, total, words = asyncio.run(measure(stream))
+            print(f"{label:<10} {first:>13.3f} {total:>11.3f} {words:>6}")
+    finally:
+        server.shutdown()
+
+
+def bench_payload(args):
+    print(f"{args.frames} frames per request, previous payload: full resolution JPEG q70")
+    print(f"{'size':>10} {'payload':>8} {'KB':>8} {'tokens':>7} {'prepare ms':>11}")
+    for size in args.sizes:
+        width, height = (int(part) for part in size.split("x"))
+        source = SyntheticFrameSource(width, height, pattern="window")
+        frames = [(i, source.grab_into(np.empty((height, width, 3), dtype=np.uint8)).copy())
+                  for i in range(args.frames)]
+
+        start = time.perf_counter()
+        previous = [cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 70])[1] for _, frame in frames]
+        elapsed = time.perf_counter() - start
+        print(f"{size:>10} {'previous':>8} {sum(len(b) for b in previous) / 1024:>8.0f} "
+              f"{estimate_tokens(width, height) * len(frames):>7} {elapsed * 1000:>11.1f}")
+        for image_format in IMAGE_FORMATS:
+            images, metrics = prepare_images(frames, image_format=image_format)
+            print(f"{size:>10} {image_format:>8} {metrics['bytes'] / 1024:>8.0f} "
+                  f"{metrics['estimated_tokens']:>7} {metrics['seconds'] * 1000:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    extraction = sub.add_parser("extraction", help="seek vs sequential frame extraction")
+    extraction.add_argument("--lengths", nargs="+", type=float, default=[20, 200, 1000],
+                            help="recording lengths in seconds")
+    extraction.add_argument("--frames", nargs="+", type=int, default=[3, 5],
+                            help="frames extracted per recording")
+    extraction.add_argument("--fps", type=float, default=3)
+    extraction.add_argument("--width", type=int, default=1280)
+    extraction.add_argument("--height", type=int, default=720)
+    extraction.add_argument("--encoder", default="opencv", choices=list(ENCODERS))
+    extraction.add_argument("--repeats", type=int, default=3)
+    extraction.set_defaults(func=bench_extraction)
+
+    client = sub.add_parser("client", help="HTTP connection reuse against a mock API server")
+    client.add_argument("--calls", type=int, default=50)
+    client.add_argument("--concurrency", type=int, default=5)
+    client.add_argument("--handshake-ms", type=float, default=30,
+                        help="delay per new connection, standing in for TCP+TLS setup")
+    client.add_argument("--latency-ms", type=float, default=20)
+    client.set_defaults(func=bench_client)
+
+    streaming = sub.add_parser("streaming", help="time to first text, blocking vs streamed replies")
+    streaming.add_argument("--tokens", type=int, default=1500)
+    streaming.add_argument("--token-ms", type=float, default=10)
+    streaming.add_argument("--latency-ms", type=float, default=500)
+    streaming.set_defaults(func=bench_streaming)
+
+    payload = sub.add_parser("payload", help="request image bytes and tokens, previous vs fitted")
+    payload.add_argument("--sizes", nargs="+", default=["1280x720", "1920x1080", "2560x1440", "3840x2160"])
+    payload.add_argument("--frames", type=int, default=5)
+    payload.set_defaults(func=bench_payload)
+
+    args = parser.parse_args()
+    if hasattr(args, "encoder") and not encoder_available(args.encoder):
+        parser.error(f"encoder not available: {args.encoder}")
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Benchmarks for the screen recorder.
+
+Runs without a display: screenshots are synthesized as mss ScreenShot
+objects and whole recordings use SyntheticFrameSource, so the numbers only
+reflect the recorder's own work.
+
+    python benchmark_recorder.py frame-path --frames 60
+    python benchmark_recorder.py encoders --seconds 20 --fps 3
+    python benchmark_recorder.py pipeline --seconds 5 --fps 30
+    python benchmark_recorder.py profiles --resolution 4k
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from threading import Event, Timer
+
+import cv2
+import numpy as np
+from mss.screenshot import ScreenShot
+
+from encoders import ENCODERS, create_encoder, encoder_available
+from frame_sources import CaptureProfile, SyntheticFrameSource, bgra_to_bgr, convert_screenshot
+from recorder import RecordingStats, record_screen
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+
+def make_screenshot(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    data = bytearray(rng.integers(0, 256, width * height * 4, dtype=np.uint8).tobytes())
+    return ScreenShot.from_size(data, width, height)
+
+
+def copy_convert(screenshot, _dst):
+    """Previous recorder path: copy the grab, then convert into a new array."""
+    return cv2.cvtColor(np.array(screenshot), cv2.COLOR_BGRA2BGR)
+
+
+def inplace_convert(screenshot, dst):
+    """Current recorder path: zero-copy view converted into a reused frame."""
+    return bgra_to_bgr(screenshot, dst)
+
+
+def measure_frame_path(convert, screenshot, frames):
+    """Return (mean ms per frame, peak bytes allocated per frame)."""
+    dst = np.empty((screenshot.height, screenshot.width, 3), dtype=np.uint8)
+    convert(screenshot, dst)  # warm up
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        convert(screenshot, dst)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        convert(screenshot, dst)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / frames * 1000, max(peaks)
+
+
+def bench_frame_path(args):
+    print(f"{'resolution':<10} {'path':<10} {'ms/frame':>9} {'alloc/frame':>12}")
+    for name in args.resolutions:
+        width, height = RESOLUTIONS[name]
+        screenshot = make_screenshot(width, height)
+        for label, convert in (("copy", copy_convert), ("in-place", inplace_convert)):
+            ms, peak = measure_frame_path(convert, screenshot, args.frames)
+            print(f"{name:<10} {label:<10} {ms:>9.2f} {peak / 1e6:>10.2f}MB")
+
+
+def cpu_seconds():
+    """CPU time of this process plus finished child processes."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def bench_encoders(args):
+    width, height = RESOLUTIONS[args.resolution]
+    frames = int(args.seconds * args.fps)
+    print(f"{frames} frames at {args.resolution}, {args.fps} fps")
+    print(f"{'encoder':<10} {'cpu ms/frame':>13} {'MB/minute':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.encoders:
+            if not encoder_available(name):
+                print(f"{name:<10} {'unavailable':>13}")
+                continue
+            path = os.path.join(tmp, f"{name}.mp4")
+            options = {"preset": args.preset, "crf": args.crf} if name == "ffmpeg" else {}
+            source = SyntheticFrameSource(width, height, pattern="window")
+            frame = np.empty((height, width, 3), dtype=np.uint8)
+            start = cpu_seconds()
+            encoder = create_encoder(name, path, args.fps, (width, height), **options)
+            for _ in range(frames):
+                encoder.write(source.grab_into(frame))
+            encoder.release()
+            cpu = cpu_seconds() - start
+            per_minute = os.path.getsize(path) / (frames / args.fps) * 60
+            print(f"{name:<10} {cpu / frames * 1000:>13.2f} {per_minute / 1e6:>10.2f}")
+
+
+def run_recording(path, source, seconds, fps, **options):
+    """Record from ``source`` for ``seconds`` and return (stats, cpu seconds)."""
+    stats = RecordingStats()
+    stop_event = Event()
+    timer = Timer(seconds, stop_event.set)
+    start = cpu_seconds()
+    timer.start()
+    record_screen(path, fps, stop_event, stats=stats, source=source, **options)
+    return stats.snapshot(), cpu_seconds() - start
+
+
+def output_bytes(path):
+    """Size of a recording including segment folders."""
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    folder = os.path.splitext(path)[0]
+    if os.path.isdir(folder):
+        return sum(os.path.getsize(os.path.join(folder, f)) for f in os.listdir(folder))
+    return 0
+
+
+def bench_pipeline(args):
+    print(f"{args.seconds}s per run at {args.fps} fps target, pattern={args.pattern}, "
+          f"change_rate={args.change_rate}, encoder={args.encoder}, pipelined={args.pipelined}, "
+          f"process={args.process}, adaptive={args.adaptive}")
+    print(f"{'resolution':<10} {'frames/s':>9} {'cpu ms/frame':>13} {'encoded':>8} "
+          f"{'dropped':>8} {'skipped':>8} {'MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.resolutions:
+            width, height = RESOLUTIONS[name]
+            source = SyntheticFrameSource(width, height, pattern=args.pattern,
+                                          change_rate=args.change_rate)
+            path = os.path.join(tmp, f"{name}.mp4")
+            stats, cpu = run_recording(
+                path, source, args.seconds, args.fps,
+                pipelined=args.pipelined, encoder_process=args.process,
+                skip_unchanged=args.skip_unchanged,
+                encoder=args.encoder, adaptive_fps=args.adaptive,
+                min_fps=args.min_fps, max_fps=args.max_fps
+            )
+            captured = max(stats["frames_captured"], 1)
+            print(f"{name:<10} {stats['frames_captured'] / args.seconds:>9.1f} "
+                  f"{cpu / captured * 1000:>13.2f} {stats['frames_encoded']:>8} "
+                  f"{stats['frames_dropped']:>8} {stats['frames_skipped']:>8} "
+                  f"{output_bytes(path) / 1e6:>8.2f}")
+
+
+def capture_profiles(width, height):
+    """Representative profiles: full screen, downscaled, and a centred window."""
+    window = {"left": width // 4, "top": height // 4, "width": width // 2, "height": height // 2}
+    return {
+        "full": None,
+        "scale-0.5": CaptureProfile(scale=0.5),
+        "fit-720p": CaptureProfile(target_size=(1280, 720)),
+        "roi": CaptureProfile(region=window),
+        "roi+0.5": CaptureProfile(region=window, scale=0.5),
+    }
+
+
+def bench_profiles(args):
+    width, height = RESOLUTIONS[args.resolution]
+    print(f"{args.resolution} screen, {args.seconds}s per run at {args.fps} fps")
+    print(f"{'profile':<10} {'output':>10} {'grab ms':>8} {'cpu ms/frame':>13} {'MB/minute':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, profile in capture_profiles(width, height).items():
+            # Conversion cost of what mss would hand back for this profile
+            crop = profile.crop(width, height) if profile else (0, 0, width, height)
+            size = profile.output_size(crop[2], crop[3]) if profile else (width, height)
+            screenshot = make_screenshot(crop[2], crop[3])
+            scaled = None
+            if size != (crop[2], crop[3]):
+                scaled = np.empty((size[1], size[0], 4), dtype=np.uint8)
+            grab_ms, _ = measure_frame_path(
+                lambda shot, dst: convert_screenshot(shot, dst, scaled), screenshot, args.frames
+            ) if scaled is not None else measure_frame_path(inplace_convert, screenshot, args.frames)
+
+            source = SyntheticFrameSource(width, height, pattern="window", profile=profile)
+            path = os.path.join(tmp, f"{name}.mp4")
+            stats, cpu = run_recording(path, source, args.seconds, args.fps, pipelined=True)
+            captured = max(stats["frames_captured"], 1)
+            per_minute = output_bytes(path) / args.seconds * 60
+            print(f"{name:<10} {size[0]:>5}x{size[1]:<4} {grab_ms:>8.2f} "
+                  f"{cpu / captured * 1000:>13.2f} {per_minute / 1e6:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    frame_path = sub.add_parser("frame-path", help="grab conversion latency and allocations")
+    frame_path.add_argument("--frames", type=int, default=60)
+    frame_path.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS),
+                            choices=list(RESOLUTIONS))
+    frame_path.set_defaults(func=bench_frame_path)
+
+    encoders = sub.add_parser("encoders", help="CPU per frame and output size per encoder")
+    encoders.add_argument("--seconds", type=float, default=20)
+    encoders.add_argument("--fps", type=float, default=3)
+    encoders.add_argument("--resolution", default="1080p", choices=list(RESOLUTIONS))
+    encoders.add_argument("--encoders", nargs="+", default=list(ENCODERS), choices=list(ENCODERS))
+    encoders.add_argument("--preset", default="ultrafast")
+    encoders.add_argument("--crf", type=int, default=28)
+    encoders.set_defaults(func=bench_encoders)
+
+    pipeline = sub.add_parser("pipeline", help="end-to-end record_screen throughput")
+    pipeline.add_argument("--seconds", type=float, default=5)
+    pipeline.add_argument("--fps", type=float, default=30)
+    pipeline.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS),
+                          choices=list(RESOLUTIONS))
+    pipeline.add_argument("--pattern", default="window", choices=SyntheticFrameSource.PATTERNS)
+    pipeline.add_argument("--change-rate", type=float, default=1.0)
+    pipeline.add_argument("--encoder", default="opencv", choices=list(ENCODERS))
+    pipeline.add_argument("--pipelined", action="store_true")
+    pipeline.add_argument("--process", action="store_true", help="encode in a worker process")
+    pipeline.add_argument("--skip-unchanged", action="store_true")
+    pipeline.add_argument("--adaptive", action="store_true", help="adaptive frame rate")
+    pipeline.add_argument("--min-fps", type=float, default=1)
+    pipeline.add_argument("--max-fps", type=float, default=10)
+    pipeline.set_defaults(func=bench_pipeline)
+
+    profiles = sub.add_parser("profiles", help="cost and output size per capture profile")
+    profiles.add_argument("--resolution", default="4k", choices=list(RESOLUTIONS))
+    profiles.add_argument("--seconds", type=float, default=5)
+    profiles.add_argument("--fps", type=float, default=5)
+    profiles.add_argument("--frames", type=int, default=30, help="frames for the grab timing")
+    profiles.set_defaults(func=bench_profiles)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
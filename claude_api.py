@@ -3,17 +3,227 @@ Claude API integration for video analysis
 """
 
 import os
+import asyncio
 import requests
 import base64
 import json
+import re
 import shutil
+import time
+from collections import deque
 from glob import glob
+from threading import Lock
 from dotenv import load_dotenv
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+from prompts import PROMPTS, prompt_version, system_blocks, task_text
+
+try:
+    import httpx
+except ImportError:  # async requests fall back to the pooled session on a thread
+    httpx = None
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Keep-alive connections held open to the API
+MAX_CONNECTIONS = 10
+
+# Client-side request quota; the API answers 429 above the account's limit
+REQUESTS_PER_MINUTE = float(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "50"))
+REQUEST_BURST = 5
+
+# Retries after a 429 (rate limited) or 529 (overloaded) response
+MAX_RETRIES = 4
+RETRY_STATUSES = (429, 529)
+
+ANALYSIS_MODEL = "claude-3-haiku-20240307"
+
+# Frame budgets of the quick and detailed analyses
+QUICK_FRAMES = 3
+DETAILED_FRAMES = 5
+FRAME_JPEG_QUALITY = 70
+
+# Encoding of the frames sent for analysis ("jpeg" or "webp"); sizes and
+# quality are fitted to the budgets in image_payload
+IMAGE_FORMAT = os.getenv("ANALYSIS_IMAGE_FORMAT", "jpeg")
+
+# Requests remembered for payload_metrics
+METRICS_HISTORY = 100
+
+# Long recordings are analyzed in windows of about this many seconds
+LONG_VIDEO_WINDOW_SECONDS = 300
+
+# Numbered step of a detailed analysis ("3. App - Feature - Action")
+STEP_PATTERN = re.compile(r"^\s*(\d+)[.)]\s+(.+)$")
+
+# Beginnings of the messages returned instead of an analysis
+ANALYSIS_ERRORS = (
+    "Claude API key not configured",
+    "No video file found",
+    "Video file not found",
+    "Could not extract frames",
+    "Analysis failed:",
+)
+
+EXTRACTION_MODES = ("auto", "seek", "sequential")
+
+# Initial guess of what one seek costs, in sequential grabs, until a seek
+# has been timed (mp4v recordings measure about 20)
+SEEK_COST_IN_GRABS = 20
+
+
+def iter_frames(cap, frame_indices, mode="auto"):
+    """Decode the frames at frame_indices from an open cv2.VideoCapture
+
+    "seek" jumps to every frame, which restarts decoding from the previous
+    keyframe each time. "sequential" walks the stream once, grab()-ing
+    the frames in between and retrieve()-ing only the selected ones.
+    "auto" times both as it goes and bridges every gap between two
+    selected frames with whichever is cheaper.
+
+    Yields (index, frame) pairs in ascending frame order.
+    """
+    import cv2
+
+    if mode not in EXTRACTION_MODES:
+        raise ValueError(f"Unknown extraction mode: {mode}")
+
+    position = 0  # frame the next grab() decodes
+    grab_cost = None
+    seek_cost = None
+
+    for target in sorted(set(frame_indices)):
+        gap = target - position
+        if mode == "auto" and gap > 0 and grab_cost is None:
+            # Time one grab to learn what skipping a frame costs
+            started = time.perf_counter()
+            if not cap.grab():
+                break
+            grab_cost = time.perf_counter() - started
+            position += 1
+            gap -= 1
+
+        if mode == "seek":
+            use_seek = gap > 0
+        elif mode == "sequential":
+            use_seek = False
+        else:
+            use_seek = gap > 0 and gap * grab_cost > (
+                seek_cost if seek_cost is not None else grab_cost * SEEK_COST_IN_GRABS
+            )
+
+        started = time.perf_counter()
+        if use_seek:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+            skipped = gap > 0
+        else:
+            skipped = all(cap.grab() for _ in range(gap))
+        ok = skipped and cap.grab()
+        elapsed = time.perf_counter() - started
+        if use_seek:
+            seek_cost = elapsed
+        elif gap > 0:
+            grab_cost = elapsed / (gap + 1)
+        position = target + 1
+
+        if not ok:
+            # Frame count in the header was larger than the stream
+            break
+        ok, frame = cap.retrieve()
+        if ok:
+            yield target, frame
+
+
+def read_frames(cap, frame_indices, mode="auto"):
+    """List of (index, frame) pairs; see iter_frames"""
+    return list(iter_frames(cap, frame_indices, mode))
+
+
+def analysis_failed(result):
+    """Whether an analyze_* result is an error message rather than an analysis"""
+    if not isinstance(result, str):
+        return True
+    # analyze_video_by_path puts a header line in front of the message
+    body = result.split("\n\n", 1)[-1]
+    return result.startswith(ANALYSIS_ERRORS) or body.startswith(ANALYSIS_ERRORS)
+
+
+def payload_cache_hash(content_hash):
+    """Frame cache namespace of a recording's payload images, or None
+
+    Thumbnails are cached under the plain content hash, keyed by the
+    requested width and never cropped, so payload images (keyed by their
+    actual size) get a suffix of their own, as does each image format.
+    """
+    if not content_hash:
+        return None
+    return f"{content_hash}.payload.{IMAGE_FORMAT}"
+
+
+def format_offset(seconds):
+    """mm:ss of an offset into a recording"""
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def merge_step_lists(parts):
+    """Merge per-window step lists into one chronological workflow
+
+    parts are (label, text) pairs in time order. Steps are renumbered
+    continuously under a heading per window and a step repeated across a
+    window boundary is kept once. A part without numbered steps (such as
+    an error message) is kept as it is.
+    """
+    lines = []
+    number = 0
+    previous = None
+    for label, text in parts:
+        lines.append(f"### {label}")
+        steps = [match.group(2).strip() for match in map(STEP_PATTERN.match, text.splitlines()) if match]
+        if not steps:
+            lines.append(text.strip())
+        for step in steps:
+            if previous is not None and step.lower() == previous.lower():
+                continue
+            number += 1
+            lines.append(f"{number}. {step}")
+            previous = step
+        lines.append("")
+    return "\n".join(lines).strip()
+
+
+class RateLimiter:
+    """Token bucket shared by every API call of an analyzer
+
+    reserve() takes a token and returns how long the caller must wait
+    before sending, so the same bucket paces threads (time.sleep) and
+    coroutines (asyncio.sleep). block() holds all callers back, e.g. for
+    the retry-after of a 429 response.
+    """
+
+    def __init__(self, per_minute=REQUESTS_PER_MINUTE, burst=REQUEST_BURST):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = Lock()
+
+    def reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def block(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
 
 class VideoAnalyzer:
     def __init__(self, api_key=None):
@@ -28,6 +238,20 @@ class VideoAnalyzer:
             "anthropic-version": "2023-06-01"
         }
 
+        # One pooled keep-alive session, so calls after the first skip the
+        # TCP and TLS handshakes
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONNECTIONS)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._async_client = None
+        self._async_loop = None
+        self.rate_limiter = RateLimiter()
+        self.rate_limited = 0
+        self.payload_stats = deque(maxlen=METRICS_HISTORY)
+        self.request_stats = deque(maxlen=METRICS_HISTORY)
+
     def get_latest_recording(self):
         """Get the most recent recording file"""
         recordings_dir = "data/recordings"
@@ -43,39 +267,208 @@ class VideoAnalyzer:
         latest_file = max(mp4_files, key=os.path.getmtime)
         return latest_file
 
-    def extract_video_frames(self, video_path, num_frames=5):
-        """Extract frames from video for analysis"""
+    def extract_video_frames(self, video_path, num_frames=5, mode="auto", frame_range=None):
+        """Extract frames from video for analysis
+
+        mode picks how the decoder reaches each frame (see read_frames).
+        frame_range = (start, end) limits the frames to part of the video.
+        Returns {"media_type", "data"} dicts with base64 data, prepared by
+        prepare_frames. The chosen indices and the encoded frames come from
+        the frame cache when this recording was analyzed before.
+        """
         try:
-            import cv2
+            from frame_cache import frame_cache
+
+            content_hash = self.content_hash(video_path)
+            # Indices live beside the payload images they were chosen for
+            cache_hash = payload_cache_hash(content_hash)
+            params = self.selection_params(num_frames)
+            if frame_range:
+                params["frame_range"] = list(frame_range)
+            frame_indices = frame_cache.get_selection(cache_hash, params) if cache_hash else None
+
+            if frame_indices is None:
+                import cv2
+
+                cap = cv2.VideoCapture(video_path)
+                total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+                cap.release()
+
+                if total_frames == 0:
+                    return []
+
+                frame_indices = self.select_frame_indices(video_path, total_frames, num_frames, frame_range)
+                if cache_hash:
+                    frame_cache.put_selection(cache_hash, params, frame_indices)
+
+            # Convert frames to base64
+            images = self.prepare_frames(video_path, frame_indices, mode, content_hash)
+            return [
+                {"media_type": image["media_type"], "data": base64.b64encode(image["data"]).decode('utf-8')}
+                for image in images
+            ]
 
+        except Exception as e:
+            print(f"Error extracting frames: {e}")
+            return []
+
+    def encode_frames(self, video_path, frame_indices, width=0, quality=FRAME_JPEG_QUALITY,
+                      mode="auto", content_hash=None):
+        """JPEG bytes of the given frames, decoding only those not in the frame cache
+
+        width scales frames down to at most that many pixels across (0 keeps
+        the video's resolution). Without a content_hash nothing is cached.
+        """
+        import cv2
+        from frame_cache import frame_cache
+
+        encoded = {}
+        if content_hash:
+            for index in frame_indices:
+                data = frame_cache.get(content_hash, index, width, quality)
+                if data is not None:
+                    encoded[index] = data
+
+        missing = [index for index in frame_indices if index not in encoded]
+        if missing:
             cap = cv2.VideoCapture(video_path)
-            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            try:
+                for index, frame in iter_frames(cap, missing, mode):
+                    if width and frame.shape[1] > width:
+                        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+                        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                    ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+                    if not ok:
+                        continue
+                    encoded[index] = buffer.tobytes()
+                    if content_hash:
+                        frame_cache.put(content_hash, index, width, quality, encoded[index])
+            finally:
+                cap.release()
+
+        return [encoded[index] for index in frame_indices if index in encoded]
+
+    def prepare_frames(self, video_path, frame_indices, mode="auto", content_hash=None):
+        """Frames of one request, fitted to the image budgets (see image_payload)
+
+        Near-duplicates are dropped, letterboxing is cropped, and size and
+        quality are chosen to fit the request's token and byte budgets. The
+        outcome is cached per frame, so a repeat decodes nothing. Every call
+        is recorded in payload_stats.
+        """
+        import cv2
+        from frame_cache import frame_cache
+        from image_payload import estimate_tokens, prepare_images
+
+        started = time.perf_counter()
+        params = {**self.payload_params(), "indices": frame_indices}
+        cache_hash = payload_cache_hash(content_hash)
+        plan = frame_cache.get_selection(cache_hash, params) if cache_hash else None
+
+        images = None
+        if plan is not None:
+            images = []
+            for entry in plan:
+                data = frame_cache.get(cache_hash, entry["index"], entry["width"], entry["quality"])
+                if data is None:
+                    images = None
+                    break
+                images.append({**entry, "data": data})
+            metrics = {"frames_in": len(frame_indices), "frames_sent": len(plan), "cached": True}
+
+        if images is None:
+            cap = cv2.VideoCapture(video_path)
+            try:
+                images, metrics = prepare_images(
+                    iter_frames(cap, frame_indices, mode), image_format=IMAGE_FORMAT
+                )
+            finally:
+                cap.release()
+            metrics["cached"] = False
+            if cache_hash:
+                for image in images:
+                    frame_cache.put(cache_hash, image["index"], image["width"], image["quality"], image["data"])
+                frame_cache.put_selection(cache_hash, params, [
+                    {key: value for key, value in image.items() if key != "data"} for image in images
+                ])
+
+        metrics.update({
+            "video": os.path.basename(video_path),
+            "bytes": sum(len(image["data"]) for image in images),
+            "estimated_tokens": sum(estimate_tokens(image["width"], image["height"]) for image in images),
+            "seconds": round(time.perf_counter() - started, 4),
+        })
+        self.payload_stats.append(metrics)
+        return images
+
+    def payload_params(self):
+        """Settings that decide how the frames of a request are encoded"""
+        import image_payload
 
-            if total_frames == 0:
-                return []
+        return {
+            "format": IMAGE_FORMAT,
+            "max_tokens": image_payload.REQUEST_TOKEN_BUDGET,
+            "max_bytes": image_payload.REQUEST_BYTE_BUDGET,
+            "max_edge": image_payload.MAX_IMAGE_EDGE,
+            "quality": [image_payload.MIN_QUALITY, image_payload.MAX_QUALITY],
+            "min_distance": image_payload.MIN_DISTANCE,
+        }
+
+    def get_thumbnail(self, video_path, width=320, quality=FRAME_JPEG_QUALITY):
+        """JPEG thumbnail of the middle frame of a recording, or None"""
+        import cv2
 
-            # Extract frames at even intervals
-            frame_indices = [int(i * total_frames / (num_frames + 1)) for i in range(1, num_frames + 1)]
-            frames = []
+        cap = cv2.VideoCapture(video_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if total_frames == 0:
+            return None
 
-            for frame_idx in frame_indices:
-                cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-                ret, frame = cap.read()
-                if ret:
-                    # Convert frame to base64
-                    _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 70])
-                    frame_b64 = base64.b64encode(buffer).decode('utf-8')
-                    frames.append(frame_b64)
+        encoded = self.encode_frames(video_path, [total_frames // 2], width, quality,
+                                     content_hash=self.content_hash(video_path))
+        return encoded[0] if encoded else None
 
-            cap.release()
-            return frames
+    def content_hash(self, video_path):
+        """Content hash used as the cache key of a recording, or None"""
+        from analysis_cache import analysis_cache
 
+        try:
+            return analysis_cache.content_hash(video_path)
         except Exception as e:
-            print(f"Error extracting frames: {e}")
-            return []
+            print(f"Could not hash {video_path}: {e}")
+            return None
 
-    def analyze_video(self, video_path):
-        """Analyze video content using Claude API"""
+    def select_frame_indices(self, video_path, total_frames, num_frames, frame_range=None):
+        """Choose which frames to extract for analysis
+
+        Candidate frames spread over the recording (the most changed frame
+        of each slice when the recorder wrote a frame index) are compared as
+        thumbnails, and the most distinct, representative ones are kept
+        (see frame_selection). A mostly static recording can therefore get
+        fewer than num_frames frames. frame_range = (start, end) restricts
+        the choice to that part of the video.
+        """
+        import cv2
+        from frame_selection import MAX_CANDIDATES, candidate_indices, select_frames
+        from recorder import load_frame_index
+
+        start, end = frame_range or (0, total_frames)
+        end = min(end, total_frames)
+        index = load_frame_index(video_path)
+        entries = [entry for entry in index["frames"] if start <= entry[0] < end] if index else None
+        candidates = candidate_indices(end - start, max(num_frames, MAX_CANDIDATES), entries, start)
+        if len(candidates) <= num_frames:
+            return candidates
+
+        cap = cv2.VideoCapture(video_path)
+        try:
+            selected = select_frames(iter_frames(cap, candidates), num_frames)
+        finally:
+            cap.release()
+        return selected or candidate_indices(end - start, num_frames, first_frame=start)
+
+    def quick_request(self, video_path):
+        """Build the summary request for a video: (payload, timeout) or an error message"""
         if not self.api_key:
             return "Claude API key not configured. Please set ANTHROPIC_API_KEY environment variable."
 
@@ -83,25 +476,13 @@ class VideoAnalyzer:
             return "No video file found to analyze."
 
         # Extract frames from video
-        frames = self.extract_video_frames(video_path, num_frames=3)
+        frames = self.extract_video_frames(video_path, num_frames=QUICK_FRAMES)
 
         if not frames:
             return "Could not extract frames from video for analysis."
 
-        # Prepare the message for Claude
-        content = [
-            {
-                "type": "text",
-                "text": """Analyze this screen recording and provide a concise summary of the user's activity.
-                Focus on:
-                - What applications or websites were being used
-                - What tasks or activities the user was performing
-                - Any notable patterns or workflows observed
-                - Productivity insights or recommendations
-
-                Keep the summary professional and under 200 words."""
-            }
-        ]
+        # Instructions go in the cached system prompt; only the frames change
+        content = [{"type": "text", "text": task_text("quick")}]
 
         # Add frames to the content
         for i, frame in enumerate(frames):
@@ -109,37 +490,33 @@ class VideoAnalyzer:
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/jpeg",
-                    "data": frame
+                    **frame
                 }
             })
 
-        payload = {
-            "model": "claude-3-haiku-20240307",
-            "max_tokens": 300,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": content
-                }
-            ]
-        }
+        return self.analysis_payload("quick", content), PROMPTS["quick"]["timeout"]
 
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
+    def analyze_video(self, video_path):
+        """Analyze video content using Claude API"""
+        request = self.quick_request(video_path)
+        if isinstance(request, str):
+            return request
+        return self.send(*request)
+
+    def send(self, payload, timeout):
+        """POST a Messages API request on the pooled session and return the reply text
 
-            if response.status_code == 200:
-                result = response.json()
-                return result["content"][0]["text"]
-            else:
-                error_msg = f"API Error {response.status_code}: {response.text}"
-                print(error_msg)
-                return f"Analysis failed: {error_msg}"
+        Requests are paced by the rate limiter and retried after 429/529.
+        """
+        try:
+            for attempt in range(MAX_RETRIES + 1):
+                time.sleep(self.rate_limiter.reserve())
+                started = time.perf_counter()
+                response = self.session.post(self.api_url, json=payload, timeout=timeout)
+                self._record_request(payload, response, started)
+                if not self._should_retry(response, attempt):
+                    break
+            return self._reply_text(response)
 
         except requests.exceptions.RequestException as e:
             error_msg = f"Network error: {str(e)}"
@@ -150,6 +527,210 @@ class VideoAnalyzer:
             print(error_msg)
             return f"Analysis failed: {error_msg}"
 
+    async def send_async(self, payload, timeout):
+        """Async send: awaits the request on a shared httpx.AsyncClient
+
+        Without httpx installed the pooled session is used on a worker thread.
+        """
+        if httpx is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.send, payload, timeout)
+
+        try:
+            client = self.get_async_client()
+            for attempt in range(MAX_RETRIES + 1):
+                await asyncio.sleep(self.rate_limiter.reserve())
+                started = time.perf_counter()
+                response = await client.post(self.api_url, json=payload, timeout=timeout)
+                self._record_request(payload, response, started)
+                if not self._should_retry(response, attempt):
+                    break
+            return self._reply_text(response)
+
+        except httpx.HTTPError as e:
+            error_msg = f"Network error: {str(e)}"
+            print(error_msg)
+            return f"Analysis failed: {error_msg}"
+        except Exception as e:
+            error_msg = f"Unexpected error: {str(e)}"
+            print(error_msg)
+            return f"Analysis failed: {error_msg}"
+
+    async def send_stream_async(self, payload, timeout, on_delta):
+        """Streaming send_async: text deltas go to the on_delta coroutine as they arrive
+
+        Returns the assembled reply text, or an error message, like send.
+        Without httpx the whole reply is passed to on_delta at once.
+        """
+        if httpx is None:
+            text = await self.send_async(payload, timeout)
+            if not analysis_failed(text):
+                await on_delta(text)
+            return text
+
+        payload = {**payload, "stream": True}
+        try:
+            client = self.get_async_client()
+            for attempt in range(MAX_RETRIES + 1):
+                await asyncio.sleep(self.rate_limiter.reserve())
+                started = time.perf_counter()
+                async with client.stream("POST", self.api_url, json=payload, timeout=timeout) as response:
+                    if response.status_code == 200:
+                        usage = {}
+                        text = await self._read_stream(response, on_delta, usage)
+                        self._record_request(payload, response, started, usage)
+                        return text
+                    await response.aread()
+                    self._record_request(payload, response, started)
+                    if not self._should_retry(response, attempt):
+                        return self._reply_text(response)
+
+        except httpx.HTTPError as e:
+            error_msg = f"Network error: {str(e)}"
+            print(error_msg)
+            return f"Analysis failed: {error_msg}"
+        except Exception as e:
+            error_msg = f"Unexpected error: {str(e)}"
+            print(error_msg)
+            return f"Analysis failed: {error_msg}"
+
+    async def _read_stream(self, response, on_delta, usage):
+        """Assemble the text of a Messages API event stream, forwarding every delta
+
+        Token counts from the message_start and message_delta events are
+        collected into usage.
+        """
+        parts = []
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:") and event in ("message_start", "message_delta"):
+                data = json.loads(line[len("data:"):])
+                usage.update(data.get("message", data).get("usage") or {})
+            elif line.startswith("data:") and event in ("content_block_delta", "error"):
+                data = json.loads(line[len("data:"):])
+                if event == "error":
+                    error_msg = f"API Error: {data.get('error', {}).get('message', data)}"
+                    print(error_msg)
+                    return f"Analysis failed: {error_msg}"
+                delta = data.get("delta", {})
+                if delta.get("type") == "text_delta":
+                    parts.append(delta["text"])
+                    await on_delta(delta["text"])
+        return "".join(parts)
+
+    def get_async_client(self):
+        """The httpx.AsyncClient of the running event loop, created on first use"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            # Connections belong to the loop that opened them
+            self._async_client = httpx.AsyncClient(
+                headers=self.headers,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS
+                )
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    async def aclose(self):
+        """Close the async client's connections"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+
+    def _should_retry(self, response, attempt):
+        """Hold the rate limiter back after a 429/529 and say whether to retry"""
+        if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+            return False
+        try:
+            delay = float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            delay = 2 ** attempt
+        self.rate_limited += 1
+        print(f"API returned {response.status_code}; retrying in {delay:.1f}s")
+        self.rate_limiter.block(delay)
+        return True
+
+    def _record_request(self, payload, response, started, usage=None):
+        """Remember the size, latency and token usage of one API request for payload_metrics
+
+        usage defaults to the usage of a complete (not streamed) reply.
+        Prompt cache reads and writes are counted apart from other input.
+        """
+        if isinstance(response, requests.Response):
+            body = response.request.body or b""
+        else:
+            body = response.request.content
+        if usage is None and response.status_code == 200:
+            try:
+                usage = response.json().get("usage")
+            except ValueError:
+                usage = None
+        usage = usage or {}
+        images = [
+            block for message in payload.get("messages", []) if isinstance(message.get("content"), list)
+            for block in message["content"] if block.get("type") == "image"
+        ]
+        self.request_stats.append({
+            "status": response.status_code,
+            "bytes": len(body),
+            "images": len(images),
+            "seconds": round(time.perf_counter() - started, 4),
+            "input_tokens": usage.get("input_tokens"),
+            "output_tokens": usage.get("output_tokens"),
+            "cache_read_tokens": usage.get("cache_read_input_tokens"),
+            "cache_write_tokens": usage.get("cache_creation_input_tokens"),
+        })
+
+    def payload_metrics(self):
+        """Averages and recent entries of payload_stats and request_stats"""
+        def average(stats, key):
+            values = [entry[key] for entry in stats if entry.get(key) is not None]
+            return round(sum(values) / len(values), 4) if values else None
+
+        def total(stats, key):
+            return sum(entry.get(key) or 0 for entry in stats)
+
+        cache_read = total(self.request_stats, "cache_read_tokens")
+        prompt_tokens = (cache_read + total(self.request_stats, "cache_write_tokens")
+                         + total(self.request_stats, "input_tokens"))
+
+        return {
+            "payloads": {
+                "count": len(self.payload_stats),
+                "avg_bytes": average(self.payload_stats, "bytes"),
+                "avg_estimated_tokens": average(self.payload_stats, "estimated_tokens"),
+                "avg_seconds": average(self.payload_stats, "seconds"),
+                "duplicates_dropped": sum(entry.get("duplicates", 0) for entry in self.payload_stats),
+                "recent": list(self.payload_stats)[-10:],
+            },
+            "requests": {
+                "count": len(self.request_stats),
+                "avg_bytes": average(self.request_stats, "bytes"),
+                "avg_seconds": average(self.request_stats, "seconds"),
+                "input_tokens": total(self.request_stats, "input_tokens"),
+                "output_tokens": total(self.request_stats, "output_tokens"),
+                "cache_read_tokens": cache_read,
+                "cache_write_tokens": total(self.request_stats, "cache_write_tokens"),
+                "cached_input_share": round(cache_read / prompt_tokens, 3) if prompt_tokens else None,
+                "recent": list(self.request_stats)[-10:],
+            },
+        }
+
+    def _reply_text(self, response):
+        """Reply text of a requests or httpx response, or an error message"""
+        if response.status_code == 200:
+            result = response.json()
+            return result["content"][0]["text"]
+        else:
+            error_msg = f"API Error {response.status_code}: {response.text}"
+            print(error_msg)
+            return f"Analysis failed: {error_msg}"
+
     def analyze_latest_recording(self):
         """Analyze the most recent recording"""
         latest_file = self.get_latest_recording()
@@ -161,8 +742,12 @@ class VideoAnalyzer:
 
         return f"Analysis of {filename}:\n\n{analysis}"
 
-    def analyze_workflow_detailed(self, video_path):
-        """Analyze video with hyperspecific workflow details"""
+    def detailed_request(self, video_path, frame_range=None, context=None):
+        """Build the detailed workflow request for a video: (payload, timeout) or an error message
+
+        frame_range limits the frames to one window of a long recording and
+        context tells Claude which part of the recording they show.
+        """
         if not self.api_key:
             return "Claude API key not configured. Please set ANTHROPIC_API_KEY environment variable."
 
@@ -170,40 +755,15 @@ class VideoAnalyzer:
             return "No video file found to analyze."
 
         # Extract more frames for detailed analysis (5 frames)
-        frames = self.extract_video_frames(video_path, num_frames=5)
+        frames = self.extract_video_frames(video_path, num_frames=DETAILED_FRAMES, frame_range=frame_range)
 
         if not frames:
             return "Could not extract frames from video for analysis."
 
-        # Hyperspecific prompt for detailed workflow
-        content = [
-            {
-                "type": "text",
-                "text": """Analyze this screen recording and provide a HYPERSPECIFIC, DETAILED workflow breakdown.
-
-                Create a numbered list that captures EVERY action, with exact details:
-
-                For each step, include:
-                - Exact application name (e.g., "Visual Studio Code", "Google Chrome", "File Explorer")
-                - Specific feature/function used (e.g., "Find and Replace dialog", "Developer Tools", "Address Bar")
-                - Precise action taken (e.g., "clicked Search button", "typed 'index.html'", "pressed Ctrl+S")
-                - Any visible text, file names, or UI elements interacted with
-
-                Format your response as:
-                1. [App Name] - [Function/Feature] - [Specific Action]
-                2. [App Name] - [Function/Feature] - [Specific Action]
-                ...
-
-                Example format:
-                1. Google Chrome - Address Bar - Typed "github.com"
-                2. Google Chrome - Navigation - Pressed Enter key
-                3. Visual Studio Code - File Explorer Panel - Clicked "src" folder
-                4. Visual Studio Code - Editor Window - Opened "main.py" file
-                5. Visual Studio Code - Editor - Typed "import sys" on line 1
-
-                Be extremely detailed and specific. Capture every observable action, click, keystroke, and navigation."""
-            }
-        ]
+        # Hyperspecific instructions are in the cached system prompt
+        content = [{"type": "text", "text": task_text("detailed")}]
+        if context:
+            content[0]["text"] += "\n\n" + task_text("window", context=context)
 
         # Add frames to the content
         for i, frame in enumerate(frames):
@@ -211,14 +771,18 @@ class VideoAnalyzer:
                 "type": "image",
                 "source": {
                     "type": "base64",
-                    "media_type": "image/jpeg",
-                    "data": frame
+                    **frame
                 }
             })
 
-        payload = {
-            "model": "claude-3-haiku-20240307",
-            "max_tokens": 1500,  # Increased for detailed output
+        return self.analysis_payload("detailed", content), PROMPTS["detailed"]["timeout"]
+
+    def analysis_payload(self, name, content):
+        """Messages API payload for a prompt template and the user content blocks"""
+        return {
+            "model": ANALYSIS_MODEL,
+            "max_tokens": PROMPTS[name]["max_tokens"],
+            "system": system_blocks(name),
             "messages": [
                 {
                     "role": "user",
@@ -227,30 +791,12 @@ class VideoAnalyzer:
             ]
         }
 
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=45
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                return result["content"][0]["text"]
-            else:
-                error_msg = f"API Error {response.status_code}: {response.text}"
-                print(error_msg)
-                return f"Analysis failed: {error_msg}"
-
-        except requests.exceptions.RequestException as e:
-            error_msg = f"Network error: {str(e)}"
-            print(error_msg)
-            return f"Analysis failed: {error_msg}"
-        except Exception as e:
-            error_msg = f"Unexpected error: {str(e)}"
-            print(error_msg)
-            return f"Analysis failed: {error_msg}"
+    def analyze_workflow_detailed(self, video_path):
+        """Analyze video with hyperspecific workflow details"""
+        request = self.detailed_request(video_path)
+        if isinstance(request, str):
+            return request
+        return self.send(*request)
 
     def analyze_latest_workflow(self):
         """Analyze the most recent recording with detailed workflow breakdown"""
@@ -278,19 +824,130 @@ class VideoAnalyzer:
         mp4_files.sort(key=os.path.getmtime, reverse=True)
         return mp4_files
 
+    def selection_params(self, num_frames):
+        """Settings that decide which frames are picked for analysis"""
+        from frame_selection import MAX_CANDIDATES, MIN_DISTANCE, THUMBNAIL_SIZE
+
+        return {
+            "frames": num_frames,
+            "max_candidates": MAX_CANDIDATES,
+            "min_distance": MIN_DISTANCE,
+            "thumbnail_size": list(THUMBNAIL_SIZE),
+        }
+
+    def cache_params(self, detailed):
+        """Everything besides the video content that shapes an analysis result"""
+        return {
+            "prompt_version": prompt_version("detailed", "window") if detailed else prompt_version("quick"),
+            "model": ANALYSIS_MODEL,
+            "detailed": bool(detailed),
+            "images": self.payload_params(),
+            **self.selection_params(DETAILED_FRAMES if detailed else QUICK_FRAMES),
+        }
+
     def analyze_video_by_path(self, video_path, detailed=True):
         """Analyze a specific video file by path"""
         if not video_path or not os.path.exists(video_path):
             return "Video file not found."
 
-        filename = os.path.basename(video_path)
-        
         if detailed:
             analysis = self.analyze_workflow_detailed(video_path)
-            return f"DETAILED WORKFLOW ANALYSIS - {filename}\n\n{analysis}"
         else:
             analysis = self.analyze_video(video_path)
-            return f"Analysis of {filename}:\n\n{analysis}"
+        return self._titled(video_path, analysis, detailed)
+
+    async def analyze_video_by_path_async(self, video_path, detailed=True, on_delta=None):
+        """Async analyze_video_by_path
+
+        Frames are prepared on a worker thread; the API request is awaited
+        without holding one. With an on_delta coroutine the reply is
+        streamed and every piece of text is passed to it as it arrives.
+        """
+        if not video_path or not os.path.exists(video_path):
+            return "Video file not found."
+
+        loop = asyncio.get_running_loop()
+        build = self.detailed_request if detailed else self.quick_request
+        request = await loop.run_in_executor(None, build, video_path)
+        if isinstance(request, str):
+            analysis = request
+        elif on_delta is not None:
+            analysis = await self.send_stream_async(*request, on_delta)
+        else:
+            analysis = await self.send_async(*request)
+        return self._titled(video_path, analysis, detailed)
+
+    def plan_windows(self, video_path, window_seconds=LONG_VIDEO_WINDOW_SECONDS):
+        """Split a recording into windows of about window_seconds
+
+        Returns (start_frame, end_frame, start_seconds, end_seconds) tuples.
+        Real capture times are used when the recorder wrote them, since
+        variable-rate recordings only have a nominal frame rate.
+        """
+        import cv2
+        from recorder import load_frame_timestamps
+
+        cap = cv2.VideoCapture(video_path)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 1.0
+        cap.release()
+        if total_frames == 0:
+            return []
+
+        timestamps = load_frame_timestamps(video_path)
+        if timestamps and len(timestamps) >= total_frames:
+            offsets = [t - timestamps[0] for t in timestamps[:total_frames]]
+        else:
+            offsets = [i / fps for i in range(total_frames)]
+
+        windows = []
+        start = 0
+        for i in range(1, total_frames):
+            if offsets[i] - offsets[start] >= window_seconds:
+                windows.append((start, i, offsets[start], offsets[i]))
+                start = i
+        windows.append((start, total_frames, offsets[start], offsets[-1] + 1.0 / fps))
+        return windows
+
+    async def analyze_window_async(self, video_path, window, part, parts):
+        """Detailed analysis of one window from plan_windows, awaited like send_async"""
+        start_frame, end_frame, start_seconds, end_seconds = window
+        context = (f"part {part} of {parts} of a longer recording, "
+                   f"{format_offset(start_seconds)} - {format_offset(end_seconds)}")
+        loop = asyncio.get_running_loop()
+        request = await loop.run_in_executor(
+            None, self.detailed_request, video_path, (start_frame, end_frame), context
+        )
+        if isinstance(request, str):
+            return request
+        return await self.send_async(*request)
+
+    def merge_windows(self, video_path, windows, results):
+        """Titled chronological workflow from the per-window results
+
+        If any window failed the merged text starts with an "Analysis
+        failed:" line naming those windows, so analysis_failed() reports
+        the whole analysis as failed while the steps that did come back
+        are kept below it.
+        """
+        parts = [
+            (f"{format_offset(window[2])} - {format_offset(window[3])}", result)
+            for window, result in zip(windows, results)
+        ]
+        merged = merge_step_lists(parts)
+        failed = [label for label, result in parts if analysis_failed(result)]
+        if failed:
+            merged = (
+                f"Analysis failed: {len(failed)} of {len(parts)} windows could not be analyzed "
+                f"({', '.join(failed)})\n\n{merged}"
+            )
+        return self._titled(video_path, merged, True)
+
+    def _titled(self, video_path, analysis, detailed):
+        filename = os.path.basename(video_path)
+        if detailed:
+            return f"DETAILED WORKFLOW ANALYSIS - {filename}\n\n{analysis}"
+        return f"Analysis of {filename}:\n\n{analysis}"
 
     def generate_title_for_analysis(self, analysis_text):
         """Generate a concise title for the analysis using AI"""
@@ -301,40 +958,28 @@ class VideoAnalyzer:
 
         # Create a short prompt to generate a title
         payload = {
-            "model": "claude-3-haiku-20240307",
-            "max_tokens": 50,
+            "model": ANALYSIS_MODEL,
+            "max_tokens": PROMPTS["title"]["max_tokens"],
             "messages": [
                 {
                     "role": "user",
-                    "content": f"Based on this workflow analysis, generate a short, descriptive title (3-6 words, no special characters except hyphens and underscores). Just return the title, nothing else:\n\n{analysis_text[:500]}"
+                    "content": task_text("title", analysis=analysis_text[:500])
                 }
             ]
         }
 
-        try:
-            response = requests.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=15
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                title = result["content"][0]["text"].strip()
-                # Clean title for filename
-                title = title.replace('"', '').replace("'", "").replace(':', '-')
-                title = ''.join(c for c in title if c.isalnum() or c in (' ', '-', '_'))
-                title = title.replace(' ', '_')
-                return title[:80]  # Limit length
-            else:
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                return f"Analysis_{timestamp}"
-        except Exception as e:
-            print(f"Title generation error: {e}")
+        # Paced and retried like every other API request
+        title = self.send(payload, PROMPTS["title"]["timeout"])
+        if analysis_failed(title):
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             return f"Analysis_{timestamp}"
 
+        # Clean title for filename
+        title = title.strip().replace('"', '').replace("'", "").replace(':', '-')
+        title = ''.join(c for c in title if c.isalnum() or c in (' ', '-', '_'))
+        title = title.replace(' ', '_')
+        return title[:80]  # Limit length
+
     def save_analysis_package(self, video_path, analysis_text, title=None):
         """Save analysis as markdown and package with video in organized folder"""
         if not video_path or not os.path.exists(video_path):
@@ -0,0 +1,127 @@
+"""
+Video encoder backends for the screen recorder.
+
+Every encoder takes BGR frames of a fixed size through ``write(frame)`` and
+finalizes the file on ``release()``. Use ``create_encoder`` to pick one by
+name.
+"""
+
+import inspect
+import os
+import shutil
+import subprocess
+
+import cv2
+
+
+class OpenCVEncoder:
+    """cv2.VideoWriter backend (mp4v by default, no external tools needed)."""
+
+    name = "opencv"
+
+    def __init__(self, path, fps, size, fourcc="mp4v"):
+        self.path = path
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if not self._writer.isOpened():
+            raise RuntimeError(f"OpenCV could not open {path} for writing")
+
+    def write(self, frame):
+        self._writer.write(frame)
+
+    def release(self):
+        self._writer.release()
+
+
+def find_ffmpeg():
+    """Path of the ffmpeg executable (FFMPEG_PATH or PATH), or None."""
+    configured = os.getenv("FFMPEG_PATH")
+    if configured and os.path.exists(configured):
+        return configured
+    return shutil.which("ffmpeg")
+
+
+class FFmpegEncoder:
+    """Pipe raw BGR frames into an ffmpeg subprocess over stdin.
+
+    Encoding runs in the ffmpeg process, outside the GIL, and x264 with a
+    fast preset produces much smaller files than mp4v.
+    """
+
+    name = "ffmpeg"
+
+    def __init__(self, path, fps, size, codec="libx264", preset="ultrafast", crf=28):
+        executable = find_ffmpeg()
+        if not executable:
+            raise RuntimeError("ffmpeg not found; install it or set FFMPEG_PATH")
+
+        self.path = path
+        width, height = size
+        command = [
+            executable, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}", "-r", str(fps),
+            "-i", "-",
+            "-c:v", codec, "-preset", preset, "-crf", str(crf),
+            # yuv420p needs even dimensions
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            path,
+        ]
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+
+    def write(self, frame):
+        # Hand ffmpeg the frame's own buffer; no bytes copy on our side
+        self._process.stdin.write(memoryview(frame).cast("B"))
+
+    def release(self):
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        errors = self._process.stderr.read()
+        self._process.wait()
+        if self._process.returncode != 0:
+            print(f"ffmpeg exited with {self._process.returncode}: {errors.decode(errors='replace').strip()}")
+
+
+ENCODERS = {
+    OpenCVEncoder.name: OpenCVEncoder,
+    FFmpegEncoder.name: FFmpegEncoder,
+}
+
+
+def encoder_available(name):
+    if name == FFmpegEncoder.name:
+        return find_ffmpeg() is not None
+    return name in ENCODERS
+
+
+def encoder_options_error(name, options):
+    """Why ``options`` cannot configure encoder ``name``, or None if they can.
+
+    Options must be keyword arguments of the encoder other than the path,
+    rate and size, with a value of the same type as the default.
+    """
+    parameters = inspect.signature(ENCODERS[name].__init__).parameters
+    accepted = {key: p.default for key, p in parameters.items() if key not in ("self", "path", "fps", "size")}
+    for key, value in (options or {}).items():
+        if key not in accepted:
+            return f"Unknown option for the {name} encoder: {key} (accepts {', '.join(accepted)})"
+        default = accepted[key]
+        if type(value) is not type(default):
+            return f"Encoder option {key} must be of type {type(default).__name__}"
+    if name == OpenCVEncoder.name and len((options or {}).get("fourcc", "mp4v")) != 4:
+        return "Encoder option fourcc must be 4 characters"
+    return None
+
+
+def create_encoder(name, path, fps, size, **options):
+    """Instantiate the encoder registered as ``name``."""
+    if name not in ENCODERS:
+        raise ValueError(f"Unknown encoder: {name}")
+    return ENCODERS[name](path, fps, size, **options)
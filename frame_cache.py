@@ -0,0 +1,152 @@
+"""
+Persistent cache of JPEG-encoded video frames.
+
+Frames are keyed by (video content hash, frame index, width, JPEG quality)
+and stored as blobs in SQLite, so repeated analyses and thumbnails of the
+same recording skip decoding and re-encoding. The frame indices chosen for
+an analysis are cached as well, letting a repeat skip frame selection too.
+"""
+
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+
+class FrameCache:
+    """SQLite-backed frame store evicting least recently used frames.
+
+    ``width`` 0 means the video's own resolution. Cached selections are
+    dropped once none of their video's frames are left. The database is
+    opened on first use.
+    """
+
+    def __init__(self, path="data/frame_cache.db", max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._conn = None
+        self._lock = Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS frames (
+                    content_hash TEXT,
+                    frame_index INTEGER,
+                    width INTEGER,
+                    quality INTEGER,
+                    data BLOB,
+                    size INTEGER,
+                    last_used REAL,
+                    PRIMARY KEY (content_hash, frame_index, width, quality)
+                );
+                CREATE INDEX IF NOT EXISTS frames_last_used ON frames (last_used);
+                CREATE TABLE IF NOT EXISTS selections (
+                    content_hash TEXT,
+                    params TEXT,
+                    indices TEXT,
+                    PRIMARY KEY (content_hash, params)
+                );
+            """)
+        return self._conn
+
+    def get(self, content_hash, frame_index, width, quality):
+        """Encoded frame bytes, or None."""
+        with self._lock:
+            conn = self._connect()
+            key = (content_hash, frame_index, width, quality)
+            row = conn.execute(
+                "SELECT data FROM frames WHERE content_hash = ? AND frame_index = ? "
+                "AND width = ? AND quality = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE frames SET last_used = ? WHERE content_hash = ? AND frame_index = ? "
+                "AND width = ? AND quality = ?", (time.time(),) + key
+            )
+            conn.commit()
+            self.hits += 1
+            return bytes(row[0])
+
+    def put(self, content_hash, frame_index, width, quality, data):
+        """Store encoded frame bytes, then evict down to ``max_bytes``."""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO frames "
+                "(content_hash, frame_index, width, quality, data, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, frame_index, width, quality, sqlite3.Binary(data), len(data), time.time())
+            )
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        """Drop least recently used frames over ``max_bytes``, then the
+        selections of videos left without any cached frame."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM frames").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT rowid, size FROM frames ORDER BY last_used"
+        ).fetchall()
+        for rowid, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM frames WHERE rowid = ?", (rowid,))
+            total -= size
+            self.evictions += 1
+            self.evicted_bytes += size
+        conn.execute(
+            "DELETE FROM selections WHERE content_hash NOT IN (SELECT DISTINCT content_hash FROM frames)"
+        )
+
+    def get_selection(self, content_hash, params):
+        """Frame indices chosen earlier for this video and selection ``params``."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT indices FROM selections WHERE content_hash = ? AND params = ?",
+                (content_hash, json.dumps(params, sort_keys=True))
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_selection(self, content_hash, params, indices):
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO selections (content_hash, params, indices) VALUES (?, ?, ?)",
+                (content_hash, json.dumps(params, sort_keys=True), json.dumps(indices))
+            )
+            conn.commit()
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM frames"
+            ).fetchone()
+            selections = conn.execute("SELECT COUNT(*) FROM selections").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "frames": count,
+            "selections": selections,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+
+frame_cache = FrameCache()
@@ -0,0 +1,116 @@
+"""
+Content-aware frame selection for video analysis.
+
+Candidate frames are reduced to small grayscale thumbnails and compared by
+RMS difference. Similar frames are clustered and one representative per
+cluster is kept, so a small frame budget covers the distinct screens of a
+recording instead of evenly spaced, often identical, moments.
+"""
+
+import cv2
+import numpy as np
+
+THUMBNAIL_SIZE = (64, 36)
+
+# Frames are decoded for at most this many candidates per recording
+MAX_CANDIDATES = 48
+
+# Thumbnails closer than this (RMS, 0-1 scale) count as the same screen
+MIN_DISTANCE = 0.02
+
+
+def thumbnail(frame, size=THUMBNAIL_SIZE):
+    """Downsampled grayscale copy of a BGR frame as a float vector in [0, 1]."""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32).ravel() / 255.0
+
+
+def pairwise_distances(thumbs):
+    """RMS difference between every pair of thumbnails."""
+    squared = np.einsum("ij,ij->i", thumbs, thumbs)
+    sums = squared[:, None] + squared[None, :] - 2.0 * thumbs @ thumbs.T
+    return np.sqrt(np.maximum(sums, 0.0) / thumbs.shape[1])
+
+
+def change_scores(thumbs):
+    """Difference of every thumbnail from the previous one (0 for the first)."""
+    scores = np.zeros(len(thumbs), dtype=np.float32)
+    if len(thumbs) > 1:
+        scores[1:] = np.sqrt(np.mean((thumbs[1:] - thumbs[:-1]) ** 2, axis=1))
+    return scores
+
+
+def candidate_indices(total_frames, count, index_entries=None, first_frame=0):
+    """Frames worth decoding as candidates.
+
+    With the recorder's frame index (``[frame, time, score]`` entries) the
+    recording is cut into ``count`` slices and the most changed frame of
+    each is used; otherwise frames are spread evenly over the
+    ``total_frames`` frames starting at ``first_frame``.
+    """
+    if index_entries and len(index_entries) >= count:
+        selected = []
+        for i in range(count):
+            window = index_entries[i * len(index_entries) // count:(i + 1) * len(index_entries) // count]
+            best = max(window, key=lambda entry: entry[2] if entry[2] is not None else -1.0)
+            selected.append(best[0])
+        return selected
+    count = min(count, total_frames)
+    return [first_frame + int(i * total_frames / (count + 1)) for i in range(1, count + 1)]
+
+
+def select_distinct(thumbs, budget, min_distance=MIN_DISTANCE, iterations=5):
+    """Positions of up to ``budget`` representative thumbnails, in time order.
+
+    Farthest-point seeding starts from the most active frame and keeps
+    adding the frame least like anything chosen so far, stopping early once
+    the rest are near-duplicates. A few k-medoids passes then move each
+    pick to the centre of its cluster.
+    """
+    if len(thumbs) == 0 or budget <= 0:
+        return []
+    distances = pairwise_distances(thumbs)
+    scores = change_scores(thumbs)
+    activity = scores + np.append(scores[1:], 0.0)
+
+    centers = [int(np.argmax(activity))]
+    nearest = distances[centers[0]].copy()
+    while len(centers) < min(budget, len(thumbs)):
+        candidate = int(np.argmax(nearest))
+        if nearest[candidate] < min_distance:
+            break
+        centers.append(candidate)
+        nearest = np.minimum(nearest, distances[candidate])
+
+    for _ in range(iterations):
+        labels = np.argmin(distances[:, centers], axis=1)
+        medoids = []
+        for cluster, center in enumerate(centers):
+            members = np.flatnonzero(labels == cluster)
+            if len(members) == 0:
+                medoids.append(center)
+                continue
+            within = distances[np.ix_(members, members)].sum(axis=1)
+            medoids.append(int(members[np.argmin(within)]))
+        if medoids == centers:
+            break
+        centers = medoids
+
+    return sorted(set(centers))
+
+
+def select_frames(frames, budget, min_distance=MIN_DISTANCE):
+    """Pick frame indices from an iterable of ``(index, frame)`` pairs.
+
+    Only thumbnails are kept, so the iterable can decode lazily.
+    """
+    indices = []
+    thumbs = []
+    for index, frame in frames:
+        indices.append(index)
+        thumbs.append(thumbnail(frame))
+    if not thumbs:
+        return []
+    picks = select_distinct(np.stack(thumbs), budget, min_distance)
+    return [indices[i] for i in picks]
@@ -0,0 +1,208 @@
+"""
+Frame sources for the screen recorder.
+
+A frame source knows its output ``size`` as ``(width, height)`` and fills a
+preallocated BGR frame on every ``grab_into(dst)`` call. ``close()``
+releases whatever the source holds. Sources accept a ``CaptureProfile`` to
+capture only part of the screen and/or at a lower resolution.
+"""
+
+import cv2
+import mss
+import numpy as np
+
+
+def bgra_view(screenshot):
+    """Zero-copy BGRA array over the pixel buffer of an mss screenshot."""
+    return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(
+        screenshot.height, screenshot.width, 4
+    )
+
+
+def bgra_to_bgr(screenshot, dst):
+    """Drop the alpha channel of a screenshot into a preallocated frame."""
+    return cv2.cvtColor(bgra_view(screenshot), cv2.COLOR_BGRA2BGR, dst=dst)
+
+
+def resize_into(src, dst):
+    """Resize ``src`` into the preallocated ``dst``.
+
+    INTER_AREA gives the cleanest text but OpenCV only has a fast path for
+    an exact 2x shrink; every other ratio uses INTER_LINEAR, which is
+    roughly ten times cheaper there.
+    """
+    src_h, src_w = src.shape[:2]
+    dst_h, dst_w = dst.shape[:2]
+    halving = src_w == dst_w * 2 and src_h == dst_h * 2
+    interpolation = cv2.INTER_AREA if halving else cv2.INTER_LINEAR
+    return cv2.resize(src, (dst_w, dst_h), dst=dst, interpolation=interpolation)
+
+
+def convert_screenshot(screenshot, dst, scaled=None):
+    """Convert a screenshot into ``dst``, resizing through ``scaled`` if given.
+
+    ``scaled`` is a reused BGRA buffer of the output size. Resizing
+    happens before the colour conversion so only the small image is
+    converted.
+    """
+    if scaled is None:
+        return bgra_to_bgr(screenshot, dst)
+    resize_into(bgra_view(screenshot), scaled)
+    return cv2.cvtColor(scaled, cv2.COLOR_BGRA2BGR, dst=dst)
+
+
+class CaptureProfile:
+    """Region of interest and output resolution applied at capture time.
+
+    ``region`` is a ``{"left", "top", "width", "height"}`` rectangle relative
+    to the captured monitor. The (cropped) image is then resized by
+    ``scale`` or to fit inside ``target_size`` = ``(width, height)`` while
+    keeping its aspect ratio. Region and output dimensions are rounded down
+    to even numbers, which most codecs require, so an unscaled region is
+    grabbed one pixel short rather than resized.
+    """
+
+    def __init__(self, region=None, scale=None, target_size=None):
+        if scale is not None and not 0 < scale <= 1:
+            raise ValueError("Capture scale must be in (0, 1]")
+        self.region = region
+        self.scale = scale
+        self.target_size = tuple(target_size) if target_size else None
+
+    def crop(self, width, height):
+        """(left, top, width, height) of the region clamped to the screen, with even dimensions."""
+        if not self.region:
+            return 0, 0, width, height
+        left = min(max(0, int(self.region.get("left", 0))), width - 2)
+        top = min(max(0, int(self.region.get("top", 0))), height - 2)
+        crop_width = min(int(self.region.get("width", width)), width - left)
+        crop_height = min(int(self.region.get("height", height)), height - top)
+        return left, top, max(2, crop_width // 2 * 2), max(2, crop_height // 2 * 2)
+
+    def output_size(self, width, height):
+        """Size of the frames produced from a ``width`` x ``height`` crop."""
+        factor = 1.0
+        if self.scale:
+            factor = self.scale
+        if self.target_size:
+            factor = min(factor, self.target_size[0] / width, self.target_size[1] / height)
+        factor = min(factor, 1.0)
+        return max(2, int(width * factor) // 2 * 2), max(2, int(height * factor) // 2 * 2)
+
+
+class MssFrameSource:
+    """Capture a real monitor with mss (1 is the primary monitor).
+
+    With a ``profile`` only the region of interest is grabbed, and
+    downscaling happens once per frame into a reused buffer.
+    """
+
+    name = "mss"
+
+    def __init__(self, monitor_index=1, profile=None):
+        self._sct = mss.mss()
+        self.monitor = self._sct.monitors[monitor_index]
+        self._area = self.monitor
+        self._scaled = None
+        self.size = (self.monitor["width"], self.monitor["height"])
+
+        if profile is not None:
+            left, top, width, height = profile.crop(self.monitor["width"], self.monitor["height"])
+            self._area = {
+                "left": self.monitor["left"] + left,
+                "top": self.monitor["top"] + top,
+                "width": width,
+                "height": height,
+            }
+            self.size = profile.output_size(width, height)
+            if self.size != (width, height):
+                self._scaled = np.empty((self.size[1], self.size[0], 4), dtype=np.uint8)
+
+    def grab_into(self, dst):
+        return convert_screenshot(self._sct.grab(self._area), dst, self._scaled)
+
+    def close(self):
+        self._sct.close()
+
+
+def desktop_background(width, height, seed=0):
+    """Light background with rows of dark runs, roughly like lines of text."""
+    rng = np.random.default_rng(seed)
+    background = np.full((height, width, 3), 235, dtype=np.uint8)
+    for y in range(40, height - 40, 24):
+        background[y:y + 10, rng.random(width) < 0.35] = 40
+    return background
+
+
+class SyntheticFrameSource:
+    """Generated frames for benchmarking without a display.
+
+    ``pattern`` is one of:
+
+    - ``"static"``: the background never changes
+    - ``"window"``: a noisy window moves across the background
+    - ``"scroll"``: the whole background scrolls vertically
+    - ``"noise"``: every change is a full frame of random pixels
+
+    ``change_rate`` is the fraction of grabs on which the scene advances;
+    the other grabs repeat the previous image exactly. A ``profile`` crops
+    and scales the rendered screen like it would a real capture.
+    """
+
+    name = "synthetic"
+    PATTERNS = ("static", "window", "scroll", "noise")
+
+    def __init__(self, width=1920, height=1080, pattern="window", change_rate=1.0, seed=0,
+                 profile=None):
+        if pattern not in self.PATTERNS:
+            raise ValueError(f"Unknown synthetic pattern: {pattern}")
+        self.size = (width, height)
+        self._crop = None
+        self._screen = None
+        if profile is not None:
+            left, top, crop_width, crop_height = profile.crop(width, height)
+            self._crop = (slice(top, top + crop_height), slice(left, left + crop_width))
+            self.size = profile.output_size(crop_width, crop_height)
+            self._screen = np.empty((height, width, 3), dtype=np.uint8)
+        self.pattern = pattern
+        self.change_rate = change_rate
+        self.step = 0
+        self._rng = np.random.default_rng(seed)
+        self._background = desktop_background(width, height, seed)
+        self._window = self._rng.integers(0, 256, (height // 3, width // 3, 3), dtype=np.uint8)
+        self._noise = None
+        if pattern == "noise":
+            self._noise = [self._rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+                           for _ in range(4)]
+
+    def grab_into(self, dst):
+        if self.step == 0 or self._rng.random() < self.change_rate:
+            self.step += 1
+        if self._screen is None:
+            self._render(self.step, dst)
+            return dst
+        self._render(self.step, self._screen)
+        region = self._screen[self._crop]
+        if (region.shape[1], region.shape[0]) == self.size:
+            np.copyto(dst, region)
+            return dst
+        return resize_into(region, dst)
+
+    def _render(self, step, dst):
+        height, width = self._background.shape[:2]
+        if self.pattern == "noise":
+            np.copyto(dst, self._noise[step % len(self._noise)])
+        elif self.pattern == "scroll":
+            offset = (step * 8) % height
+            dst[:height - offset] = self._background[offset:]
+            dst[height - offset:] = self._background[:offset]
+        else:
+            np.copyto(dst, self._background)
+            if self.pattern == "window":
+                win_h, win_w = self._window.shape[:2]
+                x = (step * 37) % (width - win_w)
+                y = (step * 19) % (height - win_h)
+                dst[y:y + win_h, x:x + win_w] = self._window
+
+    def close(self):
+        pass
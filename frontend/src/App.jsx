@@ -19,7 +19,9 @@ function App() {
                     setStatus('Recording started');
                     break;
                 case 'recording_stopped':
-                    setStatus('Recording stopped');
+                    setStatus(message.data?.error
+                        ? `Recording stopped: ${message.data.error}`
+                        : 'Recording stopped');
                     break;
                 case 'screenshot_captured':
                     setStatus('Screenshot captured');
@@ -1,6 +1,10 @@
 import React, { useState, useEffect, useRef } from 'react';
 import API from '../services/api';
 
+function newRequestId() {
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
 function AnalysisPanel() {
     const [recordings, setRecordings] = useState([]);
     const [selectedRecording, setSelectedRecording] = useState(null);
@@ -9,6 +13,8 @@ function AnalysisPanel() {
     const [loading, setLoading] = useState(false);
     const fileInputRef = useRef(null);
     const wsRef = useRef(null);
+    // Analysis whose streamed text this panel shows; other analyses are ignored
+    const requestIdRef = useRef(null);
 
     useEffect(() => {
         loadRecordings();
@@ -27,6 +33,11 @@ function AnalysisPanel() {
                     console.log('Workflow generated:', data.data);
                     setWorkflow(data.data.workflow);
                     break;
+                case 'analysis_delta':
+                    if (data.data.request_id && data.data.request_id === requestIdRef.current) {
+                        setAnalysis((previous) => previous + data.data.text);
+                    }
+                    break;
                 case 'analysis_complete':
                     if (data.data.workflow) {
                         setWorkflow(data.data.workflow);
@@ -99,12 +110,19 @@ function AnalysisPanel() {
             return;
         }
 
+        const requestId = newRequestId();
+        requestIdRef.current = requestId;
         setLoading(true);
+        setAnalysis('');
         try {
             console.log('Starting quick analysis for:', selectedRecording.path);
-            const response = await API.quickAnalysis(selectedRecording.path);
+            const response = await API.quickAnalysis(selectedRecording.path, requestId);
             console.log('Analysis response:', response);
 
+            if (requestIdRef.current !== requestId) {
+                // A newer analysis was started meanwhile
+                return;
+            }
             if (response.data.analysis) {
                 setAnalysis(response.data.analysis);
             } else {
@@ -112,9 +130,13 @@ function AnalysisPanel() {
             }
         } catch (error) {
             console.error('Error analyzing video:', error);
-            setAnalysis(`Error analyzing video: ${error.message || 'Unknown error'}`);
+            if (requestIdRef.current === requestId) {
+                setAnalysis(`Error analyzing video: ${error.message || 'Unknown error'}`);
+            }
         } finally {
-            setLoading(false);
+            if (requestIdRef.current === requestId) {
+                setLoading(false);
+            }
         }
     };
 
@@ -124,12 +146,19 @@ function AnalysisPanel() {
             return;
         }
 
+        const requestId = newRequestId();
+        requestIdRef.current = requestId;
         setLoading(true);
+        setAnalysis('');
         try {
             console.log('Starting detailed analysis for:', selectedRecording.path);
-            const response = await API.detailedAnalysis(selectedRecording.path);
+            const response = await API.detailedAnalysis(selectedRecording.path, requestId);
             console.log('Analysis response:', response);
 
+            if (requestIdRef.current !== requestId) {
+                // A newer analysis was started meanwhile
+                return;
+            }
             if (response.data.analysis) {
                 setAnalysis(response.data.analysis);
             } else {
@@ -137,9 +166,13 @@ function AnalysisPanel() {
             }
         } catch (error) {
             console.error('Error analyzing video:', error);
-            setAnalysis(`Error analyzing video: ${error.message || 'Unknown error'}`);
+            if (requestIdRef.current === requestId) {
+                setAnalysis(`Error analyzing video: ${error.message || 'Unknown error'}`);
+            }
         } finally {
-            setLoading(false);
+            if (requestIdRef.current === requestId) {
+                setLoading(false);
+            }
         }
     };
 
@@ -34,14 +34,18 @@ class API {
     }
 
     // Recording endpoints
-    async startRecording() {
-        return await axios.post(`${API_BASE}/recording/start`);
+    async startRecording(options) {
+        return await axios.post(`${API_BASE}/recording/start`, options);
     }
 
     async stopRecording() {
         return await axios.post(`${API_BASE}/recording/stop`);
     }
 
+    async saveReplay(seconds) {
+        return await axios.post(`${API_BASE}/recording/replay/save`, { seconds });
+    }
+
     async getRecordingStatus() {
         return await axios.get(`${API_BASE}/recording/status`);
     }
@@ -86,11 +90,13 @@ class API {
         }
     }
 
-    async quickAnalysis(videoPath) {
+    async quickAnalysis(videoPath, requestId) {
         try {
             return await axios.post(`${API_BASE}/analysis/quick`, {
                 video_path: videoPath,
-                detailed: false
+                detailed: false,
+                stream: true,
+                request_id: requestId
             });
         } catch (error) {
             console.error('Quick analysis error:', error.response?.data || error.message);
@@ -98,11 +104,13 @@ class API {
         }
     }
 
-    async detailedAnalysis(videoPath) {
+    async detailedAnalysis(videoPath, requestId) {
         try {
             return await axios.post(`${API_BASE}/analysis/detailed`, {
                 video_path: videoPath,
-                detailed: true
+                detailed: true,
+                stream: true,
+                request_id: requestId
             });
         } catch (error) {
             console.error('Detailed analysis error:', error.response?.data || error.message);
@@ -0,0 +1,186 @@
+"""
+Image preparation for analysis requests.
+
+Frames are cropped of letterbox borders, scaled to fit a per-request image
+token budget and encoded at the highest quality that fits a per-request
+byte budget. Near-duplicate frames are dropped first, so a request never
+pays twice for the same screen. Image tokens are estimated the way the
+Messages API counts them (about width * height / 750).
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from frame_selection import MIN_DISTANCE, thumbnail
+
+# The API scales anything with a longer edge down to this size anyway
+MAX_IMAGE_EDGE = 1568
+
+PIXELS_PER_TOKEN = 750
+
+# Limits for all images of one request together
+REQUEST_TOKEN_BUDGET = 8000
+REQUEST_BYTE_BUDGET = 1024 * 1024
+
+# Quality is searched between these; below MIN_QUALITY the frame is shrunk
+# instead. Above 75 screen text gains little for the extra bytes.
+MIN_QUALITY = 45
+MAX_QUALITY = 75
+QUALITY_STEP = 5
+
+# Border rows/columns darker than this (0-255) count as letterboxing
+LETTERBOX_THRESHOLD = 12
+
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+
+def estimate_tokens(width, height):
+    """Image tokens the API charges for an image of this size."""
+    scale = min(1.0, MAX_IMAGE_EDGE / max(width, height))
+    return int(np.ceil(width * scale * height * scale / PIXELS_PER_TOKEN))
+
+
+def crop_letterbox(frame, threshold=LETTERBOX_THRESHOLD):
+    """Frame without black bars along its edges.
+
+    At most a quarter of each dimension is removed from either side, so a
+    dark screen is never cropped away.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    rows = np.flatnonzero(gray.max(axis=1) > threshold)
+    cols = np.flatnonzero(gray.max(axis=0) > threshold)
+    if len(rows) == 0 or len(cols) == 0:
+        return frame
+    height, width = gray.shape
+    top = min(rows[0], height // 4)
+    bottom = max(rows[-1] + 1, height - height // 4)
+    left = min(cols[0], width // 4)
+    right = max(cols[-1] + 1, width - width // 4)
+    return frame[top:bottom, left:right]
+
+
+def fit_size(width, height, max_tokens):
+    """Largest (width, height) of the same aspect within max_tokens and MAX_IMAGE_EDGE."""
+    scale = min(1.0, MAX_IMAGE_EDGE / max(width, height),
+                np.sqrt(max_tokens * PIXELS_PER_TOKEN / (width * height)))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def encode(frame, quality, image_format="jpeg"):
+    """Encoded bytes of a frame, or None."""
+    extension, flag, _ = IMAGE_FORMATS[image_format]
+    ok, buffer = cv2.imencode(extension, frame, [flag, int(quality)])
+    return buffer.tobytes() if ok else None
+
+
+def encode_within(frame, max_bytes, image_format="jpeg"):
+    """(data, quality, frame) with the highest quality whose output fits max_bytes.
+
+    MAX_QUALITY is tried first, since most frames fit it. A frame that is
+    too big even at MIN_QUALITY is scaled down by the size it overshoots
+    by, since encoded size grows about linearly with the pixel count.
+    """
+    data = encode(frame, MAX_QUALITY, image_format)
+    if data is not None and len(data) <= max_bytes:
+        return data, MAX_QUALITY, frame
+
+    for _ in range(3):
+        data = encode(frame, MIN_QUALITY, image_format)
+        if data is None or len(data) <= max_bytes:
+            break
+        height, width = frame.shape[:2]
+        scale = 0.95 * np.sqrt(max_bytes / len(data))
+        if width * scale < 320:
+            return data, MIN_QUALITY, frame
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    else:
+        data = encode(frame, MIN_QUALITY, image_format)
+
+    # Binary search over qualities QUALITY_STEP apart
+    best = (data, MIN_QUALITY)
+    qualities = list(range(MIN_QUALITY + QUALITY_STEP, MAX_QUALITY, QUALITY_STEP))
+    low, high = 0, len(qualities) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        data = encode(frame, qualities[middle], image_format)
+        if data is not None and len(data) <= max_bytes:
+            best = (data, qualities[middle])
+            low = middle + 1
+        else:
+            high = middle - 1
+    return best[0], best[1], frame
+
+
+def drop_duplicates(frames, min_distance=MIN_DISTANCE):
+    """(index, frame) pairs without frames that look like the one kept before them."""
+    kept = []
+    previous = None
+    for index, frame in frames:
+        thumb = thumbnail(frame)
+        if previous is not None and np.sqrt(np.mean((thumb - previous) ** 2)) < min_distance:
+            continue
+        kept.append((index, frame))
+        previous = thumb
+    return kept
+
+
+def prepare_images(frames, max_tokens=REQUEST_TOKEN_BUDGET, max_bytes=REQUEST_BYTE_BUDGET,
+                   image_format="jpeg"):
+    """Encode ``(index, frame)`` pairs for one request.
+
+    Returns ``(images, metrics)``: images are dicts with the frame index,
+    encoded data, media type, size and quality; metrics summarize what was
+    dropped and what the request will carry. Bytes a frame does not use
+    are passed on to the frames after it.
+    """
+    started = time.perf_counter()
+    frames = list(frames)
+    _, _, media_type = IMAGE_FORMATS[image_format]
+
+    # Crop and scale first, so duplicates are found on the smaller frames
+    fitted = []
+    cropped = 0
+    for index, frame in frames:
+        trimmed = crop_letterbox(frame)
+        if trimmed.shape != frame.shape:
+            cropped += 1
+        height, width = trimmed.shape[:2]
+        size = fit_size(width, height, max_tokens / len(frames))
+        if size != (width, height):
+            trimmed = cv2.resize(trimmed, size, interpolation=cv2.INTER_AREA)
+        fitted.append((index, trimmed))
+    unique = drop_duplicates(fitted)
+
+    images = []
+    remaining = max_bytes
+    for position, (index, frame) in enumerate(unique):
+        data, quality, encoded = encode_within(frame, remaining // (len(unique) - position), image_format)
+        if data is None:
+            continue
+        remaining -= len(data)
+        images.append({
+            "index": index,
+            "data": data,
+            "media_type": media_type,
+            "width": encoded.shape[1],
+            "height": encoded.shape[0],
+            "quality": quality,
+        })
+
+    metrics = {
+        "frames_in": len(frames),
+        "frames_sent": len(images),
+        "duplicates": len(frames) - len(unique),
+        "cropped": cropped,
+        "bytes": sum(len(image["data"]) for image in images),
+        "estimated_tokens": sum(estimate_tokens(image["width"], image["height"]) for image in images),
+        "source_tokens": sum(estimate_tokens(frame.shape[1], frame.shape[0]) for _, frame in frames),
+        "seconds": round(time.perf_counter() - started, 4),
+    }
+    return images, metrics
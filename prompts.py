@@ -0,0 +1,88 @@
+"""
+Prompt templates of the video analysis requests.
+
+Every template carries a version that is part of the analysis cache key,
+so editing a prompt must bump its version. The static instructions are
+sent as the system prompt and marked for prompt caching; only the frames
+and a short task line change between requests.
+"""
+
+QUICK_SYSTEM = """You analyze screen recordings, given as a few frames in time order, and summarize the user's activity.
+
+Focus on:
+- What applications or websites were being used
+- What tasks or activities the user was performing
+- Any notable patterns or workflows observed
+- Productivity insights or recommendations
+
+Keep the summary professional and under 200 words."""
+
+DETAILED_SYSTEM = """You analyze screen recordings, given as frames in time order, and produce a HYPERSPECIFIC, DETAILED workflow breakdown.
+
+Create a numbered list that captures EVERY action, with exact details.
+
+For each step, include:
+- Exact application name (e.g., "Visual Studio Code", "Google Chrome", "File Explorer")
+- Specific feature/function used (e.g., "Find and Replace dialog", "Developer Tools", "Address Bar")
+- Precise action taken (e.g., "clicked Search button", "typed 'index.html'", "pressed Ctrl+S")
+- Any visible text, file names, or UI elements interacted with
+
+Format your response as:
+1. [App Name] - [Function/Feature] - [Specific Action]
+2. [App Name] - [Function/Feature] - [Specific Action]
+...
+
+Example format:
+1. Google Chrome - Address Bar - Typed "github.com"
+2. Google Chrome - Navigation - Pressed Enter key
+3. Visual Studio Code - File Explorer Panel - Clicked "src" folder
+4. Visual Studio Code - Editor Window - Opened "main.py" file
+5. Visual Studio Code - Editor - Typed "import sys" on line 1
+
+Be extremely detailed and specific. Capture every observable action, click, keystroke, and navigation."""
+
+PROMPTS = {
+    "quick": {
+        "version": 2,
+        "system": QUICK_SYSTEM,
+        "task": "Summarize the user's activity in this screen recording.",
+        "max_tokens": 300,
+        "timeout": 30,
+    },
+    "detailed": {
+        "version": 2,
+        "system": DETAILED_SYSTEM,
+        "task": "Break this screen recording down into a detailed numbered workflow.",
+        "max_tokens": 1500,
+        "timeout": 45,
+    },
+    "window": {
+        "version": 1,
+        "task": "These frames show {context}. List only the actions in this part.",
+    },
+    "title": {
+        "version": 1,
+        "task": "Based on this workflow analysis, generate a short, descriptive title (3-6 words, no special characters except hyphens and underscores). Just return the title, nothing else:\n\n{analysis}",
+        "max_tokens": 50,
+        "timeout": 15,
+    },
+}
+
+
+def prompt_version(*names):
+    """Version string of the named prompts, for cache keys"""
+    return ",".join(f"{name}-v{PROMPTS[name]['version']}" for name in names)
+
+
+def system_blocks(name):
+    """System prompt of a template as content blocks, cached by the API
+
+    The API only caches prefixes above a model-specific minimum length
+    (1024 tokens, 2048 for Haiku models); shorter prompts are processed
+    as usual and report no cache reads or writes.
+    """
+    return [{"type": "text", "text": PROMPTS[name]["system"], "cache_control": {"type": "ephemeral"}}]
+
+
+def task_text(name, **fields):
+    return PROMPTS[name]["task"].format(**fields)
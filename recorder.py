@@ -1,49 +1,816 @@
-import cv2
-import mss
+import json
+import multiprocessing
 import numpy as np
+import os
 import time
-from threading import Event
+from collections import deque
+from multiprocessing import shared_memory
+from queue import Queue, Empty
+from threading import Event, Lock, Thread
 
+from encoders import create_encoder
+from frame_sources import CaptureProfile, MssFrameSource
 
-def record_screen(output_file, fps=3, stop_event=None):
-    """Record screen to MP4 file with configurable FPS."""
+
+class RecordingStats:
+    """Thread-safe counters shared between the recorder and its manager."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._values = {
+            "frames_captured": 0,
+            "frames_encoded": 0,
+            "frames_dropped": 0,
+            "frames_skipped": 0,
+            "frames_idle": 0,
+        }
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self._values[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class FrameBufferPool:
+    """Bounded pool of preallocated frames handed from capture to encoder.
+
+    The capture side takes a free buffer, fills it and submits it; the
+    encoder side writes it out and releases it back to the pool. When the
+    encoder falls behind, the pool runs dry and the capture side drops the
+    frame instead of waiting. If the encoder fails it records why with
+    ``fail()`` and stops, and the capture side ends the recording.
+    """
+
+    def __init__(self, count, shape):
+        self._free = Queue()
+        self._ready = Queue()
+        self._error = None
+        for _ in range(count):
+            self._free.put(np.empty(shape, dtype=np.uint8))
+
+    def acquire(self):
+        """Return a free buffer, or None if all buffers are in flight."""
+        try:
+            return self._free.get_nowait()
+        except Empty:
+            return None
+
+    def submit(self, frame, timestamp, score=None):
+        self._ready.put((frame, timestamp, score))
+
+    def next_ready(self):
+        """Block until a filled buffer is available; None means closed."""
+        return self._ready.get()
+
+    def release(self, frame):
+        self._free.put(frame)
+
+    def fail(self, message):
+        self._error = message
+
+    def failure(self):
+        """Why the encoder stopped early, or None while it is working."""
+        return self._error
+
+    def close(self):
+        """Queue an end marker after all frames already submitted."""
+        self._ready.put(None)
+
+
+class FrameScheduler:
+    """Pace capture on absolute deadlines of the monotonic clock.
+
+    Deadline ``n`` is ``start + n / fps``, so sleep overshoot never
+    accumulates and wall-clock adjustments do not disturb pacing. When a
+    tick is more than a full interval late, ``catch_up="skip"`` jumps to
+    the current deadline and counts the missed ticks, while ``"burst"``
+    keeps every deadline and captures the backlog back-to-back.
+    """
+
+    def __init__(self, fps, catch_up="skip", start_at=None, window=256):
+        if catch_up not in ("skip", "burst"):
+            raise ValueError(f"Unknown catch-up policy: {catch_up}")
+        self.fps = fps
+        self.interval = 1.0 / fps
+        self.catch_up = catch_up
+        self.ticks = 0
+        self.late_frames = 0
+        self.skipped_ticks = 0
+        self._start = start_at if start_at is not None else time.monotonic()
+        self._next = 0
+        self._lateness = deque(maxlen=window)
+        self._tick_times = deque(maxlen=window)
+
+    def set_fps(self, fps):
+        """Change the rate from the next deadline on, keeping it absolute."""
+        if fps == self.fps:
+            return
+        self._start += self._next * self.interval
+        self._next = 0
+        self.fps = fps
+        self.interval = 1.0 / fps
+
+    def wait(self, stop_event=None):
+        """Sleep until the next deadline and return the monotonic tick time."""
+        deadline = self._start + self._next * self.interval
+        now = time.monotonic()
+        if now < deadline:
+            if stop_event is not None:
+                stop_event.wait(deadline - now)
+            else:
+                time.sleep(deadline - now)
+            now = time.monotonic()
+
+        lateness = now - deadline
+        if lateness > self.interval / 2:
+            self.late_frames += 1
+        if lateness >= self.interval and self.catch_up == "skip":
+            missed = int(lateness / self.interval)
+            self.skipped_ticks += missed
+            self._next += missed
+            lateness -= missed * self.interval
+
+        self._lateness.append(lateness)
+        self._tick_times.append(now)
+        self._next += 1
+        self.ticks += 1
+        return now
+
+    def metrics(self):
+        """Achieved rate and jitter over the most recent ticks."""
+        achieved = None
+        if len(self._tick_times) >= 2:
+            span = self._tick_times[-1] - self._tick_times[0]
+            if span > 0:
+                achieved = round((len(self._tick_times) - 1) / span, 3)
+        jitter = None
+        if self._lateness:
+            p50, p95, p99 = np.percentile(np.fromiter(self._lateness, dtype=np.float64), [50, 95, 99])
+            jitter = {
+                "p50": round(float(p50) * 1000, 2),
+                "p95": round(float(p95) * 1000, 2),
+                "p99": round(float(p99) * 1000, 2),
+            }
+        return {
+            "target_fps": self.fps,
+            "achieved_fps": achieved,
+            "jitter_ms": jitter,
+            "late_frames": self.late_frames,
+            "skipped_ticks": self.skipped_ticks,
+            "catch_up": self.catch_up,
+        }
+
+
+class ChangeDetector:
+    """Decide whether a frame differs from the last accepted one.
+
+    Frames are compared on a strided subsample of the green channel, which
+    costs a few thousand pixel reads per frame regardless of resolution.
+    The reference is only advanced when a frame is accepted, so slow
+    gradual changes still add up and eventually trigger a new frame.
+    """
+
+    def __init__(self, threshold=1.0, step=16):
+        self.threshold = threshold
+        self.step = step
+        self._reference = None
+        self._pending = None
+
+    def fingerprint(self, frame):
+        return frame[::self.step, ::self.step, 1].astype(np.int16)
+
+    def score(self, frame):
+        """Mean absolute difference against the reference (inf if none)."""
+        fingerprint = self.fingerprint(frame)
+        self._pending = fingerprint
+        if self._reference is None:
+            return float("inf")
+        return float(np.abs(fingerprint - self._reference).mean())
+
+    def accept(self):
+        self._reference = self._pending
+
+
+class AdaptiveFrameRate:
+    """Pick a capture rate between ``min_fps`` and ``max_fps`` from activity.
+
+    Activity is a moving average of how often consecutive frames differ by
+    at least ``threshold``. The rate rises quickly when the screen starts
+    changing and decays slowly once it settles, so bursts are captured at
+    full rate without flapping between rates.
+    """
+
+    def __init__(self, min_fps, max_fps, threshold=1.0, rise=0.5, decay=0.05):
+        if not 0 < min_fps <= max_fps:
+            raise ValueError("Adaptive frame rate needs 0 < min_fps <= max_fps")
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.threshold = threshold
+        self.rise = rise
+        self.decay = decay
+        self.activity = 0.0
+
+    def update(self, score):
+        """Feed the latest change score and return the rate to use next."""
+        changed = 1.0 if score >= self.threshold else 0.0
+        weight = self.rise if changed > self.activity else self.decay
+        self.activity += weight * (changed - self.activity)
+        fps = self.min_fps + (self.max_fps - self.min_fps) * self.activity
+        # Quantize so small activity wobbles do not re-anchor the scheduler
+        return round(fps * 2) / 2 if fps >= 1 else round(fps, 2)
+
+
+class IdleMonitor:
+    """Detect sustained inactivity and keep the resulting pause intervals.
+
+    The recording is paused once no frame has differed from the last
+    encoded one by ``threshold`` for ``idle_seconds``, and resumes on the
+    first frame that does.
+    """
+
+    def __init__(self, idle_seconds, threshold=1.0):
+        self.idle_seconds = idle_seconds
+        self.threshold = threshold
+        self.paused = False
+        self.pauses = []
+        self._last_change = None
+
+    def update(self, score, timestamp):
+        """Feed the latest change score; return True while paused."""
+        if self._last_change is None or score >= self.threshold:
+            self._last_change = timestamp
+            if self.paused:
+                self.resume(timestamp)
+        elif not self.paused and timestamp - self._last_change >= self.idle_seconds:
+            self.paused = True
+            self.pauses.append({"start": timestamp, "end": None, "duration": None})
+        return self.paused
+
+    def resume(self, timestamp):
+        self.paused = False
+        pause = self.pauses[-1]
+        pause["end"] = timestamp
+        pause["duration"] = round(timestamp - pause["start"], 3)
+
+
+def sidecar_path(video_path, kind):
+    """Path of a JSON sidecar stored next to a recording."""
+    return f"{os.path.splitext(video_path)[0]}.{kind}.json"
+
+
+class TimestampSidecar:
+    """Real capture times of every encoded frame of a variable-rate video."""
+
+    def __init__(self, video_path, fps):
+        self.path = sidecar_path(video_path, "frames")
+        self.video = os.path.basename(video_path)
+        self.fps = fps
+        self.start_time = None
+        self.timestamps = []
+
+    def add(self, timestamp):
+        if self.start_time is None:
+            self.start_time = timestamp
+        self.timestamps.append(round(timestamp - self.start_time, 4))
+
+    def write(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({
+                "video": self.video,
+                "nominal_fps": self.fps,
+                "start_time": self.start_time,
+                "timestamps": self.timestamps,
+            }, f)
+
+
+def load_frame_timestamps(video_path):
+    """Return absolute capture times per encoded frame, or None if unknown."""
+    path = sidecar_path(video_path, "frames")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    start = data.get("start_time") or 0.0
+    return [start + t for t in data.get("timestamps", [])]
+
+
+class FrameIndex:
+    """Per-frame change scores written next to a video as ``.index.json``.
+
+    Each entry is ``[frame_number, seconds_from_start, change_score]`` for
+    an encoded frame, where the score is the mean fingerprint difference
+    from the previously encoded frame (null for the first one). Frame
+    selection can use it instead of decoding the video.
+    """
+
+    def __init__(self, video_path, fps):
+        self.path = sidecar_path(video_path, "index")
+        self.video = os.path.basename(video_path)
+        self.fps = fps
+        self.start_time = None
+        self.frames = []
+
+    def add(self, timestamp, score):
+        if self.start_time is None:
+            self.start_time = timestamp
+        if score is not None and score != float("inf"):
+            score = round(score, 2)
+        else:
+            score = None
+        self.frames.append([len(self.frames), round(timestamp - self.start_time, 3), score])
+
+    def write(self):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({
+                "video": self.video,
+                "fps": self.fps,
+                "start_time": self.start_time,
+                "frames": self.frames,
+            }, f, separators=(",", ":"))
+
+
+def load_frame_index(video_path):
+    """Return the ``FrameIndex`` data of a recording, or None if absent."""
+    path = sidecar_path(video_path, "index")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class VideoFileWriter:
+    """Video file written by one of the ``encoders`` backends.
+
+    Optionally records the capture time of every frame in a sidecar and
+    the change score of every frame in a ``FrameIndex``.
+    """
+
+    def __init__(self, path, fps, size, record_timestamps=False,
+                 encoder="opencv", encoder_options=None, write_index=False):
+        self.path = path
+        self._encoder = create_encoder(encoder, path, fps, size, **(encoder_options or {}))
+        self.sidecar = TimestampSidecar(path, fps) if record_timestamps else None
+        self.index = FrameIndex(path, fps) if write_index else None
+
+    def write(self, frame, timestamp, score=None):
+        self._encoder.write(frame)
+        if self.sidecar is not None:
+            self.sidecar.add(timestamp)
+        if self.index is not None:
+            self.index.add(timestamp, score)
+
+    def release(self):
+        self._encoder.release()
+        if self.sidecar is not None:
+            self.sidecar.write()
+        if self.index is not None:
+            self.index.write()
+
+
+def segment_manifest_path(output_file):
+    """Manifest location for a segmented recording started as ``output_file``."""
+    return os.path.join(os.path.splitext(output_file)[0], "manifest.json")
+
+
+def load_segment_manifest(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class SegmentedVideoWriter:
+    """Roll the recording into fixed-length MP4 segments.
+
+    Segments are written to a folder named after ``output_file`` and listed
+    in ``manifest.json`` as soon as they are closed, so consumers can start
+    on finished segments while recording continues. The manifest is marked
+    ``complete`` once the last segment has been released.
+    """
+
+    def __init__(self, output_file, fps, size, segment_seconds, record_timestamps=False,
+                 encoder="opencv", encoder_options=None, write_index=False):
+        self.directory = os.path.splitext(output_file)[0]
+        self.name = os.path.basename(self.directory)
+        self.manifest_path = segment_manifest_path(output_file)
+        self.fps = fps
+        self.size = size
+        self.segment_seconds = segment_seconds
+        self.record_timestamps = record_timestamps
+        self.encoder = encoder
+        self.encoder_options = encoder_options
+        self.write_index = write_index
+        self.segments = []
+        self._writer = None
+        self._first_timestamp = None
+        self._last_timestamp = None
+        self._frames = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_manifest(complete=False)
+
+    def write(self, frame, timestamp, score=None):
+        if (self._writer is not None
+                and timestamp - self._first_timestamp >= self.segment_seconds):
+            self._finish_segment()
+        if self._writer is None:
+            filename = f"{self.name}_part{len(self.segments):03d}.mp4"
+            self._writer = VideoFileWriter(
+                os.path.join(self.directory, filename), self.fps, self.size,
+                record_timestamps=self.record_timestamps,
+                encoder=self.encoder,
+                encoder_options=self.encoder_options,
+                write_index=self.write_index
+            )
+            self._first_timestamp = timestamp
+            self._frames = 0
+        self._writer.write(frame, timestamp, score)
+        self._last_timestamp = timestamp
+        self._frames += 1
+
+    def release(self):
+        if self._writer is not None:
+            self._finish_segment()
+        self._write_manifest(complete=True)
+
+    def _finish_segment(self):
+        self._writer.release()
+        self.segments.append({
+            "file": os.path.basename(self._writer.path),
+            "start_time": self._first_timestamp,
+            "duration": round(self._last_timestamp - self._first_timestamp + 1.0 / self.fps, 3),
+            "frames": self._frames,
+        })
+        self._writer = None
+        self._write_manifest(complete=False)
+
+    def _write_manifest(self, complete):
+        # Write-then-rename so readers never see a half-written manifest
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "session": self.name,
+                "fps": self.fps,
+                "segment_seconds": self.segment_seconds,
+                "complete": complete,
+                "segments": self.segments,
+            }, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+
+def open_writer(output_file, fps, size, segment_seconds=None, **writer_options):
+    """Create the file writer for a recording, segmented or not."""
+    if segment_seconds:
+        return SegmentedVideoWriter(output_file, fps, size, segment_seconds, **writer_options)
+    return VideoFileWriter(output_file, fps, size, **writer_options)
+
+
+class SharedFramePool:
+    """Ring of frames in shared memory, encoded by a separate process.
+
+    Offers the capture side the same interface as ``FrameBufferPool``, but
+    the buffers live in a ``multiprocessing.shared_memory`` block and the
+    writer runs in a worker process. Only slot numbers, timestamps and
+    scores cross the process boundary, never pixel data, so encoding
+    runs on another core without contending for this process's GIL.
+    """
+
+    def __init__(self, count, shape, writer_args):
+        context = multiprocessing.get_context("spawn")
+        frame_bytes = int(np.prod(shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=count * frame_bytes)
+        self._frames = [
+            np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * frame_bytes)
+            for slot in range(count)
+        ]
+        self._slots = {id(frame): slot for slot, frame in enumerate(self._frames)}
+        self._free = context.Queue()
+        self._ready = context.Queue()
+        for slot in range(count):
+            self._free.put(slot)
+        self._errors = context.Queue()
+        self._encoded = context.Value("q", 0)
+        self._last_write = context.Value("d", 0.0)
+        self.process = context.Process(
+            target=_encode_process,
+            args=(self._shm.name, count, shape, self._ready, self._free,
+                  self._errors, self._encoded, self._last_write, writer_args),
+            daemon=True
+        )
+        self.process.start()
+
+    def acquire(self):
+        """Return a free shared frame, or None if all are in flight."""
+        try:
+            return self._frames[self._free.get_nowait()]
+        except Empty:
+            return None
+
+    def submit(self, frame, timestamp, score=None):
+        self._ready.put((self._slots[id(frame)], timestamp, score))
+
+    def release(self, frame):
+        self._free.put(self._slots[id(frame)])
+
+    def failure(self):
+        """Why the worker stopped early, or None while it is working."""
+        try:
+            return self._errors.get_nowait()
+        except Empty:
+            pass
+        if not self.process.is_alive():
+            return f"Encoder process exited with code {self.process.exitcode}"
+        return None
+
+    def close(self):
+        """Queue an end marker after all frames already submitted."""
+        self._ready.put(None)
+
+    def join(self):
+        """Wait for the worker to flush, then free the shared block."""
+        self.process.join()
+        self._frames = []
+        self._slots = {}
+        try:
+            self._shm.close()
+        except BufferError:
+            # A caller still holds a frame view; the block is unlinked anyway
+            pass
+        self._shm.unlink()
+
+    def status(self):
+        """Worker health and backlog for status reporting."""
+        try:
+            depth = self._ready.qsize()
+        except NotImplementedError:
+            # Not available on macOS
+            depth = None
+        last_write = self._last_write.value
+        return {
+            "pid": self.process.pid,
+            "alive": self.process.is_alive(),
+            "exitcode": self.process.exitcode,
+            "queue_depth": depth,
+            "frames_encoded": self._encoded.value,
+            "seconds_since_write": round(time.time() - last_write, 3) if last_write else None,
+        }
+
+
+def _encode_process(shm_name, count, shape, ready, free, errors, encoded, last_write, writer_args):
+    """Worker process body: write frames from the shared ring to disk.
+
+    Stops at the first failed write and reports it through ``errors``.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frame_bytes = int(np.prod(shape))
+    frames = [
+        np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * frame_bytes)
+        for slot in range(count)
+    ]
+    args, options = writer_args
+    out = open_writer(*args, **options)
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                break
+            slot, timestamp, score = item
+            try:
+                out.write(frames[slot], timestamp, score)
+                with encoded.get_lock():
+                    encoded.value += 1
+                last_write.value = time.time()
+            except Exception as e:
+                print(f"Encoding error: {e}")
+                errors.put(f"Encoding failed: {e}")
+                break
+            finally:
+                free.put(slot)
+    finally:
+        out.release()
+        del frames
+        shm.close()
+
+
+def _encode_worker(out, pool, stats):
+    """Drain filled buffers from the pool into the video writer.
+
+    Stops at the first failed write, such as a crashed ffmpeg or a full
+    disk, and marks the pool as failed so the capture loop ends too.
+    """
+    while True:
+        item = pool.next_ready()
+        if item is None:
+            break
+        frame, timestamp, score = item
+        try:
+            out.write(frame, timestamp, score)
+            stats.increment("frames_encoded")
+        except Exception as e:
+            print(f"Encoding error: {e}")
+            pool.fail(f"Encoding failed: {e}")
+            break
+        finally:
+            pool.release(frame)
+
+
+def record_screen(output_file, fps=3, stop_event=None, pipelined=False,
+                  queue_size=8, stats=None, skip_unchanged=False,
+                  change_threshold=1.0, segment_seconds=None, catch_up="skip",
+                  encoder="opencv", encoder_options=None, monitor_index=1,
+                  start_at=None, writer=None, write_index=True, source=None,
+                  adaptive_fps=False, min_fps=1, max_fps=10,
+                  idle_pause_seconds=None, heartbeat_fps=None, capture_region=None,
+                  capture_scale=None, capture_size=None, encoder_process=False):
+    """Record screen to MP4 file with configurable FPS.
+
+    Frames come from ``source`` (see ``frame_sources``); by default the
+    mss monitor ``monitor_index`` is captured (1 is the primary one),
+    limited to ``capture_region`` and downscaled by ``capture_scale`` or to
+    fit ``capture_size`` when those are given (see ``CaptureProfile``).
+    Pipelines recording several monitors share a ``start_at`` time on the
+    monotonic clock so their frame deadlines line up.
+
+    With ``pipelined=True`` capture and encoding run on separate threads
+    connected by a pool of ``queue_size`` preallocated frame buffers, so an
+    encoder stall drops frames instead of delaying the capture clock.
+    ``encoder_process=True`` does the same with a shared-memory ring and
+    an encoder worker process (see ``SharedFramePool``).
+
+    With ``skip_unchanged=True`` frames that do not differ from the last
+    encoded one by at least ``change_threshold`` are not encoded, and the
+    real capture time of each encoded frame is written to a ``.frames.json``
+    sidecar so the variable frame rate can be reconstructed later.
+
+    With ``adaptive_fps=True`` the rate starts at ``fps`` and then follows
+    on-screen activity between ``min_fps`` and ``max_fps`` (see
+    ``AdaptiveFrameRate``). Capture times are then written to the
+    ``.frames.json`` sidecar, as the video frame rate is only nominal.
+
+    With ``idle_pause_seconds`` set, encoding pauses after that long
+    without a change and resumes on the first changed frame. Capture can
+    drop to ``heartbeat_fps`` while paused, trading resume latency for
+    fewer grabs. Pause intervals are reported through ``stats``.
+
+    With ``segment_seconds`` set, the recording is split into segments of
+    that length listed in a manifest (see ``SegmentedVideoWriter``).
+
+    Frames are encoded with the ``encoder`` backend from ``encoders``
+    (``"opencv"`` or ``"ffmpeg"``), configured by ``encoder_options``.
+    Passing a ``writer`` (any object with ``write(frame, timestamp, score)``
+    and ``release()``, such as a ``ReplayBuffer``) replaces the file output;
+    it always runs in this process.
+
+    With ``write_index=True`` the change score of every encoded frame is
+    saved to a ``.index.json`` sidecar (see ``FrameIndex``).
+
+    Capture is paced by a ``FrameScheduler`` using the ``catch_up`` policy
+    for late frames. Frame counters and timing metrics are reported through
+    ``stats`` if one is given.
+    """
     if stop_event is None:
         stop_event = Event()
+    if stats is None:
+        stats = RecordingStats()
 
     # Initialize screen capture
-    sct = mss.mss()
-    monitor = sct.monitors[1]  # Primary monitor
+    if source is None:
+        profile = None
+        if capture_region or capture_scale or capture_size:
+            profile = CaptureProfile(capture_region, capture_scale, capture_size)
+        source = MssFrameSource(monitor_index, profile)
+
+    # Video writer
+    width, height = source.size
+    writer_options = {
+        "segment_seconds": segment_seconds,
+        "record_timestamps": bool(skip_unchanged or adaptive_fps or idle_pause_seconds),
+        "encoder": encoder,
+        "encoder_options": encoder_options,
+        "write_index": write_index,
+    }
+    use_process = encoder_process and writer is None
+    if use_process:
+        # The worker process opens the writer itself
+        out = None
+    elif writer is not None:
+        out = writer
+    else:
+        out = open_writer(output_file, fps, (width, height), **writer_options)
+
+    scheduler = FrameScheduler(fps, catch_up=catch_up, start_at=start_at)
+    metrics_every = max(1, int(round(fps)))
+    rate = AdaptiveFrameRate(min_fps, max_fps, change_threshold) if adaptive_fps else None
+    idle = IdleMonitor(idle_pause_seconds, change_threshold) if idle_pause_seconds else None
+
+    # Scores feed frame skipping, rate adaptation, idle detection and the frame index
+    needs_scores = skip_unchanged or write_index or adaptive_fps or idle is not None
+    detector = ChangeDetector(change_threshold) if needs_scores else None
 
-    # Video codec and writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    width = monitor["width"]
-    height = monitor["height"]
-    out = cv2.VideoWriter(output_file, fourcc, fps, (width, height))
+    # Single reused frame when encoding inline; the pool owns frames otherwise
+    scratch = None
+    pool = None
+    encoder_thread = None
+    if use_process:
+        pool = SharedFramePool(
+            queue_size, (height, width, 3),
+            ((output_file, fps, (width, height)), writer_options)
+        )
+    elif pipelined:
+        pool = FrameBufferPool(queue_size, (height, width, 3))
+        encoder_thread = Thread(target=_encode_worker, args=(out, pool, stats), daemon=True)
+        encoder_thread.start()
+    else:
+        scratch = np.empty((height, width, 3), dtype=np.uint8)
 
-    frame_delay = 1.0 / fps
+    def publish_metrics():
+        stats.set("timing", scheduler.metrics())
+        if use_process:
+            worker = pool.status()
+            stats.set("encoder_process", worker)
+            stats.set("frames_encoded", worker["frames_encoded"])
 
     try:
         while not stop_event.is_set():
+            scheduler.wait(stop_event)
+            if stop_event.is_set():
+                break
             start_time = time.time()
 
-            # Capture screen
-            screenshot = sct.grab(monitor)
-            frame = np.array(screenshot)
+            failure = pool.failure() if pool is not None else None
+            if failure:
+                # Nothing would ever encode a frame again
+                raise RuntimeError(failure)
 
-            # Convert from BGRA to BGR (remove alpha channel)
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+            frame = pool.acquire() if pool is not None else scratch
+            if frame is None:
+                # Encoder is behind; keep the capture clock steady
+                stats.increment("frames_dropped")
+            else:
+                # Capture screen straight into the BGR frame
+                source.grab_into(frame)
+                stats.increment("frames_captured")
 
-            # Write frame to video
-            out.write(frame)
+                score = detector.score(frame) if detector is not None else None
 
-            # Control frame rate
-            elapsed = time.time() - start_time
-            sleep_time = max(0, frame_delay - elapsed)
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+                was_paused = idle is not None and idle.paused
+                paused = idle is not None and idle.update(score, start_time)
+                if paused != was_paused:
+                    if heartbeat_fps:
+                        # Heartbeat grabs while idle; back to the normal rate on change
+                        scheduler.set_fps(heartbeat_fps if paused else fps)
+                    stats.set("paused", paused)
+                    stats.set("pauses", [dict(pause) for pause in idle.pauses])
+                if rate is not None and not paused:
+                    scheduler.set_fps(rate.update(score))
+
+                if paused:
+                    stats.increment("frames_idle")
+                    if pool is not None:
+                        pool.release(frame)
+                elif skip_unchanged and score < change_threshold:
+                    stats.increment("frames_skipped")
+                    if pool is not None:
+                        pool.release(frame)
+                else:
+                    if detector is not None:
+                        detector.accept()
+                    if pool is not None:
+                        pool.submit(frame, start_time, score)
+                    else:
+                        # Write frame to video
+                        out.write(frame, start_time, score)
+                        stats.increment("frames_encoded")
+                frame = None
+
+            if scheduler.ticks % metrics_every == 0:
+                publish_metrics()
 
     except Exception as e:
         print(f"Recording error: {e}")
+        stats.set("error", str(e))
     finally:
-        out.release()
-        cv2.destroyAllWindows()
\ No newline at end of file
+        if idle is not None:
+            if idle.paused:
+                idle.resume(time.time())
+            stats.set("paused", False)
+            stats.set("pauses", [dict(pause) for pause in idle.pauses])
+        if pool is not None:
+            # Let the encoder flush everything that was already captured
+            pool.close()
+            if encoder_thread is not None:
+                encoder_thread.join()
+            else:
+                pool.join()
+        publish_metrics()
+        if out is not None:
+            out.release()
+        source.close()
@@ -0,0 +1,96 @@
+"""
+In-memory replay buffer for "save the last N minutes" recordings.
+"""
+
+import time
+from collections import deque
+from threading import Lock
+
+import cv2
+
+from recorder import VideoFileWriter
+
+
+class ReplayBuffer:
+    """Bounded ring of JPEG-compressed frames.
+
+    Used as the writer of ``record_screen``: frames are compressed as they
+    arrive and the oldest ones are evicted once they are more than
+    ``max_seconds`` old or the compressed data exceeds ``max_bytes``.
+    ``save`` works on a snapshot of the ring, so it can run on another
+    thread while capture keeps appending.
+    """
+
+    def __init__(self, max_seconds, max_bytes=256 * 1024 * 1024, quality=80):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.frame_size = None
+        self.evicted = 0
+        self._frames = deque()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def write(self, frame, timestamp, score=None):
+        ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return
+        with self._lock:
+            self.frame_size = (frame.shape[1], frame.shape[0])
+            self._frames.append((timestamp, encoded, score))
+            self._bytes += encoded.nbytes
+            while self._frames and (
+                self._bytes > self.max_bytes
+                or timestamp - self._frames[0][0] > self.max_seconds
+            ):
+                _, dropped, _ = self._frames.popleft()
+                self._bytes -= dropped.nbytes
+                self.evicted += 1
+
+    def release(self):
+        """Nothing to finalize; frames stay available until evicted."""
+
+    def snapshot(self, seconds=None):
+        """Buffered (timestamp, jpeg, score) entries, optionally only the last ``seconds``."""
+        with self._lock:
+            frames = list(self._frames)
+        if seconds is not None and frames:
+            cutoff = frames[-1][0] - seconds
+            frames = [item for item in frames if item[0] >= cutoff]
+        return frames
+
+    def save(self, path, fps, seconds=None, encoder="opencv", encoder_options=None):
+        """Write the buffered frames to a video file and return its details."""
+        frames = self.snapshot(seconds)
+        if not frames:
+            return None
+
+        started = time.time()
+        writer = VideoFileWriter(path, fps, self.frame_size, record_timestamps=True,
+                                 encoder=encoder, encoder_options=encoder_options,
+                                 write_index=True)
+        try:
+            for timestamp, encoded, score in frames:
+                writer.write(cv2.imdecode(encoded, cv2.IMREAD_COLOR), timestamp, score)
+        finally:
+            writer.release()
+
+        return {
+            "path": path,
+            "frames": len(frames),
+            "duration": round(frames[-1][0] - frames[0][0] + 1.0 / fps, 3),
+            "save_seconds": round(time.time() - started, 3),
+        }
+
+    def stats(self):
+        with self._lock:
+            frames = len(self._frames)
+            buffered = self._frames[-1][0] - self._frames[0][0] if frames else 0.0
+            return {
+                "frames": frames,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "seconds": round(buffered, 3),
+                "max_seconds": self.max_seconds,
+                "evicted": self.evicted,
+            }
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import sqlite3
 import time
@@ -17,6 +18,15 @@ def timestamped_filename():
     return time.strftime("recording_%Y%m%d_%H%M%S")
 
 
+def file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
 def init_db():
     """Initialize SQLite database with usage table."""
     conn = sqlite3.connect("data/usage.db", check_same_thread=False)